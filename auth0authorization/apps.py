@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class Auth0AuthorizationConfig(AppConfig):
     name = 'auth0authorization'
+
+    def ready(self):
+        import auth0authorization.signals
@@ -0,0 +1,42 @@
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.compat import gettext_lazy as _
+
+from .utils import resolve_user
+
+
+class Auth0JSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """
+    drf-jwt authentication that resolves the token subject through the
+    cached user resolver instead of querying `auth_user` on every request.
+
+    The decoded claims are kept on `request.token_claims` so scope checks
+    never parse the token again.
+    """
+
+    def authenticate(self, request):
+        self.claims = None
+        result = super().authenticate(request)
+        if result is not None:
+            request.token_claims = self.claims
+        return result
+
+    def authenticate_credentials(self, payload):
+        # Authenticator instances are created per request
+        self.claims = payload
+        username = self.jwt_get_username_from_payload(payload)
+
+        if not username:
+            msg = _('Invalid payload.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        user = resolve_user(username)
+        if user is None:
+            msg = _('Invalid token.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        if not user.is_active:
+            msg = _('User account is disabled.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        return user
@@ -0,0 +1,140 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_process_local(backend):
+    "True for cache backends that every worker keeps to itself (local memory, dummy)."
+    return isinstance(backend, (LocMemCache, DummyCache))
+
+
+class VerifiedClaimsCache:
+    """
+    Bounded LRU of the claims of tokens that already passed signature,
+    audience and issuer verification.
+
+    Entries are keyed by a SHA-256 digest of the raw token (so the cache never
+    holds bearer tokens) and expire at the token's `exp` claim.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        if isinstance(token, str):
+            token = token.encode()
+        return hashlib.sha256(token).digest()
+
+    def get(self, token):
+        "Returns the cached claims of `token`, or None on a miss."
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, claims = entry
+                if time.time() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return claims
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, token, claims):
+        expires_at = claims.get('exp')
+        if not isinstance(expires_at, (int, float)) or self.max_size <= 0:
+            # Tokens without an expiry are verified every time
+            return
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (expires_at, claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        "Returns the hit/miss counters and the current size."
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+class UserCache:
+    """
+    Resolves usernames (derived from the token `sub`) to `User` instances.
+
+    Lookups go through a process-local LRU first, then the shared Django
+    cache, and only touch the database for users neither has seen. Saving or
+    deleting a user invalidates both (see `signals`), but only in the worker
+    that made the change: other workers pick it up once their local entry is
+    older than `ttl` seconds. With a per-process Django cache (the local
+    memory default) there is nothing to pick it up from, so its entries
+    live no longer than `ttl` either.
+
+    Every call returns its own copy of the user, so related objects cached
+    on it by one request (`user.profile`) are never served to the next.
+    """
+
+    key_prefix = 'auth0:user:'
+
+    def __init__(self, max_size=1024, ttl=60, shared_timeout=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_timeout = shared_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username, loader):
+        """
+        Returns the user for `username`, calling `loader(username)` on a miss.
+        `loader` returns None when no user can be found or provisioned.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and now < entry[0]:
+                self._entries.move_to_end(username)
+                return self.fresh_copy(entry[1])
+
+        shared_key = self.key_prefix + username
+        user = cache.get(shared_key)
+        if user is None:
+            user = loader(username)
+            if user is None:
+                return None
+            cache.set(shared_key, user, self.get_shared_timeout())
+
+        with self._lock:
+            self._entries[username] = (now + self.ttl, user)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return self.fresh_copy(user)
+
+    def get_shared_timeout(self):
+        if is_process_local(caches[DEFAULT_CACHE_ALIAS]):
+            return min(self.shared_timeout, self.ttl)
+        return self.shared_timeout
+
+    @staticmethod
+    def fresh_copy(user):
+        "A copy of the cached `user` without the related objects loaded through it."
+        user = copy.copy(user)
+        user._state.fields_cache = {}
+        user.__dict__.pop('_prefetched_objects_cache', None)
+        return user
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+        cache.delete(self.key_prefix + username)
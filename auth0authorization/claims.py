@@ -0,0 +1,43 @@
+import jwt
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.blacklist.exceptions import MissingToken
+
+
+class TokenClaims(dict):
+    """
+    Verified access token claims, with the space separated `scope` claim
+    parsed once into a frozenset.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scopes = frozenset((self.get('scope') or '').split())
+
+    def has_scope(self, scope):
+        return scope in self.scopes
+
+
+def get_token_claims(request):
+    """
+    Returns the claims of the request's access token, or None without a valid token.
+    The authentication layer sets them once per request, requests that did not go
+    through it are decoded with the (cached) decode handler.
+    """
+    claims = getattr(request, 'token_claims', None)
+    if claims is not None:
+        return claims
+
+    from .utils import jwt_decode_token
+
+    try:
+        token = JSONWebTokenAuthentication.get_token_from_request(request)
+    except MissingToken:
+        return None
+    if not token:
+        return None
+    try:
+        claims = jwt_decode_token(token)
+    except jwt.InvalidTokenError:
+        return None
+    request.token_claims = claims
+    return claims
@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+
+import jwt
+import requests
+
+
+class JWKSKeyStore:
+    """
+    In-process cache of the public keys published at a JWKS endpoint.
+
+    Keys are parsed once into `RSAAlgorithm` public keys and indexed by `kid`.
+    The key set is refetched when it is older than `ttl` seconds, or when a
+    token carries a `kid` we have never seen (at most once every
+    `min_refresh_interval` seconds, so garbage tokens can't hammer Auth0).
+    If a refetch fails while we still hold keys, the stale keys keep serving
+    until the endpoint comes back. Without any keys, tokens are rejected
+    and the endpoint is retried at most once per `min_refresh_interval`.
+    """
+
+    def __init__(self, url, ttl=600, min_refresh_interval=30, timeout=5):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._fetched_at = None
+        self._last_miss_refresh = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    def get_key(self, kid):
+        "Returns the public key for `kid`, raising `jwt.InvalidTokenError` if it is unknown."
+        if self._is_expired():
+            self._refresh(force=True)
+        key = self._keys.get(kid)
+        if key is None and self._refresh(force=False):
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError('Public key not found.')
+        return key
+
+    def _is_expired(self):
+        return self._fetched_at is None or time.monotonic() - self._fetched_at >= self.ttl
+
+    def _refresh(self, force):
+        """
+        Refetch the key set, returns True if the keys were replaced.
+        Unless `force` is set (TTL expiry), refetches are rate limited by
+        `min_refresh_interval`.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if force and self._fetched_at is not None and now - self._fetched_at < self.ttl:
+                # Another thread refreshed while we were waiting for the lock
+                return True
+            if not self._keys and self._failed_at is not None \
+                    and now - self._failed_at < self.min_refresh_interval:
+                raise jwt.InvalidTokenError('JWKS endpoint unavailable, retrying later.')
+            if not force:
+                if self._last_miss_refresh is not None \
+                        and now - self._last_miss_refresh < self.min_refresh_interval:
+                    return False
+                self._last_miss_refresh = now
+            try:
+                keys = self._fetch()
+            except (requests.RequestException, ValueError, KeyError) as err:
+                if not self._keys:
+                    self._failed_at = now
+                    raise jwt.InvalidTokenError(f'Unable to fetch JWKS: {err}')
+                # Serve the stale keys, retry after `min_refresh_interval`
+                self._fetched_at = now - self.ttl + self.min_refresh_interval
+                return False
+            self._keys = keys
+            self._fetched_at = now
+            self._failed_at = None
+            return True
+
+    def _fetch(self):
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        keys = {}
+        for jwk in response.json()['keys']:
+            if jwk.get('kty') != 'RSA' or 'kid' not in jwk:
+                continue
+            keys[jwk['kid']] = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+        return keys
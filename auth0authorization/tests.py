@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from auth0authorization import utils
+from auth0authorization.authentication import Auth0JSONWebTokenAuthentication
+from auth0authorization.cache import UserCache, VerifiedClaimsCache
+from auth0authorization.jwks import JWKSKeyStore
+from mains.models import Profile
+from mains.permissions import HasScope
+
+
+def make_rsa_key(kid):
+    "Returns (private PEM, public JWK dict) for a fresh RSA key."
+    private_key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend())
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({'kid': kid, 'use': 'sig', 'alg': 'RS256'})
+    return pem, jwk
+
+
+class JWKSHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.hits += 1
+        if self.server.failing:
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps({'keys': self.server.keys}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalJWKSMixin:
+
+    # Setup a local stand-in for the Auth0 JWKS endpoint
+    def setUp(self):
+        self.pem1, self.jwk1 = make_rsa_key('key-1')
+        self.pem2, self.jwk2 = make_rsa_key('key-2')
+        self.server = HTTPServer(('127.0.0.1', 0), JWKSHandler)
+        self.server.keys = [self.jwk1]
+        self.server.hits = 0
+        self.server.failing = False
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/.well-known/jwks.json"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JWKSKeyStoreTest(LocalJWKSMixin, SimpleTestCase):
+
+    def test_keys_are_cached(self):
+        store = JWKSKeyStore(self.url, ttl=600, min_refresh_interval=30)
+        token = jwt.encode({'sub': 'auth0|1'}, self.pem1, algorithm='RS256', headers={'kid': 'key-1'})
+        for _ in range(5):
+            payload = jwt.decode(token, store.get_key('key-1'), algorithms=['RS256'])
+        self.assertEqual(payload['sub'], 'auth0|1')
+        self.assertEqual(self.server.hits, 1)
+
+    def test_unknown_kid_refetches_once(self):
+        store = JWKSKeyStore(self.url, ttl=600, min_refresh_interval=30)
+        store.get_key('key-1')
+        # Key rotation: the new key is picked up on the first miss
+        self.server.keys = [self.jwk1, self.jwk2]
+        self.assertIsNotNone(store.get_key('key-2'))
+        self.assertEqual(self.server.hits, 2)
+        # Unknown kids are rate limited
+        for _ in range(3):
+            with self.assertRaises(jwt.InvalidTokenError):
+                store.get_key('bogus')
+        self.assertEqual(self.server.hits, 2)
+
+    def test_stale_keys_served_while_endpoint_is_down(self):
+        store = JWKSKeyStore(self.url, ttl=600, min_refresh_interval=30)
+        key = store.get_key('key-1')
+        self.server.failing = True
+        with mock.patch('auth0authorization.jwks.time.monotonic', return_value=10 ** 6):
+            self.assertIs(store.get_key('key-1'), key)
+        self.assertEqual(self.server.hits, 2)
+
+    def test_no_keys_and_endpoint_down(self):
+        self.server.failing = True
+        store = JWKSKeyStore(self.url, min_refresh_interval=30)
+        for _ in range(3):
+            with self.assertRaises(jwt.InvalidTokenError):
+                store.get_key('key-1')
+        # Failed fetches are rate limited too
+        self.assertEqual(self.server.hits, 1)
+        self.server.failing = False
+        with mock.patch('auth0authorization.jwks.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertIsNotNone(store.get_key('key-1'))
+        self.assertEqual(self.server.hits, 2)
+
+
+class Auth0TenantMixin(LocalJWKSMixin):
+
+    def setUp(self):
+        super().setUp()
+        env = {'AUTH0_DOMAIN': 'https://tenant.auth0.test/', 'API_IDENTIFIER': 'https://api.test'}
+        patchers = [
+            mock.patch.dict(os.environ, env),
+            mock.patch.object(utils, '_jwks_store', JWKSKeyStore(self.url)),
+            mock.patch.object(utils, '_claims_cache', VerifiedClaimsCache(max_size=2)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_token(self, sub, exp=None, scope=None):
+        payload = {
+            'sub': sub,
+            'iss': 'https://tenant.auth0.test/',
+            'aud': 'https://api.test',
+            'exp': exp or int(time.time()) + 3600,
+        }
+        if scope is not None:
+            payload['scope'] = scope
+        return jwt.encode(payload, self.pem1, algorithm='RS256', headers={'kid': 'key-1'}).decode()
+
+
+class VerifiedClaimsCacheTest(Auth0TenantMixin, SimpleTestCase):
+
+    def test_repeated_token_skips_verification(self):
+        token = self.make_token('auth0|1')
+        with mock.patch('auth0authorization.utils.jwt.decode', wraps=jwt.decode) as decode:
+            for _ in range(3):
+                claims = utils.jwt_decode_token(token)
+        self.assertEqual(claims['sub'], 'auth0|1')
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(utils.get_claims_cache().stats(), {'hits': 2, 'misses': 1, 'size': 1})
+
+    def test_cache_is_bounded(self):
+        tokens = [self.make_token(f'auth0|{i}') for i in range(3)]
+        for token in tokens:
+            utils.jwt_decode_token(token)
+        cache = utils.get_claims_cache()
+        self.assertIsNone(cache.get(tokens[0]))
+        self.assertIsNotNone(cache.get(tokens[2]))
+
+    def test_entry_expires_with_token(self):
+        token = self.make_token('auth0|1', exp=int(time.time()) + 60)
+        utils.jwt_decode_token(token)
+        with mock.patch('auth0authorization.cache.time.time', return_value=time.time() + 120):
+            self.assertIsNone(utils.get_claims_cache().get(token))
+
+
+class ResolveUserTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(utils, '_user_cache', UserCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_new_subject_is_provisioned_once(self):
+        username = utils.jwt_get_username_from_payload_handler({'sub': 'auth0|42'})
+        self.assertEqual(username, 'auth0.42')
+        user = utils.resolve_user(username)
+        self.assertTrue(User.objects.filter(username='auth0.42').exists())
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertEqual(utils.resolve_user(username), user)
+
+    def test_shared_cache_backs_local_cache(self):
+        User.objects.create_user('auth0.7')
+        utils.resolve_user('auth0.7')
+        # A fresh worker only has the shared cache
+        with mock.patch.object(utils, '_user_cache', UserCache()):
+            with self.assertNumQueries(0):
+                self.assertEqual(utils.resolve_user('auth0.7').username, 'auth0.7')
+
+    def test_saving_user_invalidates_cache(self):
+        user = User.objects.create_user('auth0.8')
+        utils.resolve_user('auth0.8')
+        user.is_active = False
+        user.save()
+        self.assertFalse(utils.resolve_user('auth0.8').is_active)
+
+    def test_related_objects_are_not_shared_between_requests(self):
+        user = User.objects.create_user('auth0.9')
+        profile = Profile.objects.create(user=user, first_name="Dung")
+        self.assertEqual(utils.resolve_user('auth0.9').profile.first_name, "Dung")
+        profile.first_name = "Minh"
+        profile.save()
+        self.assertEqual(utils.resolve_user('auth0.9').profile.first_name, "Minh")
+
+    def test_process_local_cache_lives_no_longer_than_ttl(self):
+        # The test settings use the local memory backend
+        self.assertEqual(UserCache(ttl=60, shared_timeout=3600).get_shared_timeout(), 60)
+
+
+class ScopedView(APIView):
+    authentication_classes = [Auth0JSONWebTokenAuthentication]
+    permission_classes = [HasScope]
+    required_scopes = ('read:posts',)
+
+    def get(self, request):
+        return Response({'scopes': sorted(request.token_claims.scopes)})
+
+
+class RequestClaimsTest(Auth0TenantMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        patcher = mock.patch.object(utils, '_user_cache', UserCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = APIRequestFactory()
+
+    def get(self, token):
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return ScopedView.as_view()(request)
+
+    def test_claims_are_decoded_once_per_request(self):
+        token = self.make_token('auth0|1', scope='openid read:posts')
+        with mock.patch('auth0authorization.utils.jwt.decode', wraps=jwt.decode) as decode:
+            response = self.get(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['scopes'], ['openid', 'read:posts'])
+        self.assertEqual(decode.call_count, 1)
+
+    def test_missing_scope_is_forbidden(self):
+        response = self.get(self.make_token('auth0|1', scope='openid'))
+        self.assertEqual(response.status_code, 403)
@@ -1,33 +1,88 @@
+from django.conf import settings
 from django.contrib.auth import authenticate
-import json
+from django.contrib.auth.models import User
 
 import jwt
-import requests
 import os
+
+from .cache import UserCache, VerifiedClaimsCache
+from .claims import TokenClaims
+from .jwks import JWKSKeyStore
 # from dotenv import load_dotenv
 
 # load_dotenv()
 
 
-# Function that map the sub field from the access_token to the username,
-# and use authenticate method to create a remote user in the Django authentication system
+# Function that map the sub field from the access_token to the username.
+# The user itself is resolved (and provisioned once) by `resolve_user`.
 def jwt_get_username_from_payload_handler(payload):
-	username = payload.get('sub').replace('|', '.')
-	authenticate(remote_user=username)
-	return username
+	return payload.get('sub').replace('|', '.')
+
+
+def _load_user(username):
+	try:
+		return User.objects.get_by_natural_key(username)
+	except User.DoesNotExist:
+		# First request of this subject, use authenticate method to create
+		# a remote user in the Django authentication system
+		return authenticate(remote_user=username)
+
+
+def resolve_user(username):
+	"Returns the user for `username`, touching the database only for unseen subjects."
+	return get_user_cache().get(username, _load_user)
+
+
+_jwks_store = None
+_claims_cache = None
+_user_cache = None
+
 
+def get_jwks_store():
+	"Returns the process-wide JWKS key store for the configured Auth0 domain."
+	global _jwks_store
+	if _jwks_store is None:
+		_jwks_store = JWKSKeyStore(
+			f"{os.environ['AUTH0_DOMAIN']}.well-known/jwks.json",
+			ttl=getattr(settings, 'AUTH0_JWKS_TTL', 600),
+			min_refresh_interval=getattr(settings, 'AUTH0_JWKS_MIN_REFRESH_INTERVAL', 30),
+		)
+	return _jwks_store
 
-# Function to fetch the JWKS from the Auth0 account to verify and decode the incoming Access Token
+
+def get_claims_cache():
+	"Returns the process-wide cache of verified token claims."
+	global _claims_cache
+	if _claims_cache is None:
+		_claims_cache = VerifiedClaimsCache(
+			max_size=getattr(settings, 'AUTH0_CLAIMS_CACHE_SIZE', 1024)
+		)
+	return _claims_cache
+
+
+def get_user_cache():
+	"Returns the process-wide subject to user cache."
+	global _user_cache
+	if _user_cache is None:
+		_user_cache = UserCache(
+			max_size=getattr(settings, 'AUTH0_USER_CACHE_SIZE', 1024),
+			ttl=getattr(settings, 'AUTH0_USER_CACHE_TTL', 60),
+		)
+	return _user_cache
+
+
+# Function to verify and decode the incoming Access Token with the cached Auth0 JWKS.
+# Tokens seen before are answered from the verified-claims cache until they expire.
 def jwt_decode_token(token):
-	header = jwt.get_unverified_header(token)
-	jwks = requests.get(f"{os.environ['AUTH0_DOMAIN']}.well-known/jwks.json").json()
-	public_key = None
-	for jwk in jwks['keys']:
-	    if jwk['kid'] == header['kid']:
-	        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+	claims_cache = get_claims_cache()
+	claims = claims_cache.get(token)
+	if claims is not None:
+		return claims
 
-	if public_key is None:
-		raise Exception('Public key not found.')
+	header = jwt.get_unverified_header(token)
+	public_key = get_jwks_store().get_key(header.get('kid'))
 
 	issuer = os.environ['AUTH0_DOMAIN']
-	return jwt.decode(token, public_key, audience=os.environ['API_IDENTIFIER'], issuer=issuer, algorithms=['RS256'])
\ No newline at end of file
+	claims = TokenClaims(jwt.decode(token, public_key, audience=os.environ['API_IDENTIFIER'], issuer=issuer, algorithms=['RS256']))
+	claims_cache.set(token, claims)
+	return claims
\ No newline at end of file
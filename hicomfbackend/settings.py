@@ -71,12 +71,36 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'auth0authorization.authentication.Auth0JSONWebTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     )
 }
 
+# Default number of rows per page for keyset paginated endpoints (`?page_size=` overrides it, up to 100).
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 20))
+
+# Posts are pushed to the home timeline of each friend, except for users with more
+# friends than the limit: their posts of the last days are pulled when a friend reads.
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', 1000))
+TIMELINE_PULL_WINDOW_DAYS = int(os.getenv('TIMELINE_PULL_WINDOW_DAYS', 7))
+
+# Friend lists (user ids) are kept in the default cache, invalidated when
+# friendships change. The timeout (seconds) bounds how long a lost update lives.
+FRIEND_CACHE_TIMEOUT = int(os.getenv('FRIEND_CACHE_TIMEOUT', 3600))
+# Invalidations don't reach other workers through a per-process cache (the local
+# memory default), friend lists are then kept only this long (seconds).
+FRIEND_CACHE_LOCAL_TIMEOUT = int(os.getenv('FRIEND_CACHE_LOCAL_TIMEOUT', 5))
+
+# Friend graph (mains.graph) used for mutual friends and suggestions. Point the
+# snapshot at a file refreshed by `manage.py build_friend_graph` so workers share
+# one memory-mapped copy, otherwise each worker rebuilds the graph from the database
+# in a background thread and misses the changes made through other workers. Production
+# needs the snapshot (`manage.py check --deploy` warns, mains.W001).
+# Workers look for a new snapshot (or reload) every interval (seconds).
+FRIEND_GRAPH_SNAPSHOT = os.getenv('FRIEND_GRAPH_SNAPSHOT', '')
+FRIEND_GRAPH_REFRESH_INTERVAL = int(os.getenv('FRIEND_GRAPH_REFRESH_INTERVAL', 300))
+
 JWT_AUTH = {
     'JWT_PAYLOAD_GET_USERNAME_HANDLER':
         'auth0authorization.utils.jwt_get_username_from_payload_handler',
@@ -90,8 +114,36 @@ JWT_AUTH = {
     'JWT_AUTH_HEADER_PREFIX': 'Bearer',
 }
 
+# Auth0 signing keys are cached in-process, refetched after the TTL (seconds)
+# or on an unknown `kid`, at most once per refresh interval.
+AUTH0_JWKS_TTL = int(os.getenv('AUTH0_JWKS_TTL', 600))
+AUTH0_JWKS_MIN_REFRESH_INTERVAL = int(os.getenv('AUTH0_JWKS_MIN_REFRESH_INTERVAL', 30))
+# Number of verified access tokens whose claims are kept until they expire.
+AUTH0_CLAIMS_CACHE_SIZE = int(os.getenv('AUTH0_CLAIMS_CACHE_SIZE', 1024))
+# Users resolved from token subjects, kept per process for the TTL (seconds)
+# in front of the shared cache below. With the local memory default nothing is
+# shared, so deactivated users are picked up by every worker within the TTL.
+AUTH0_USER_CACHE_SIZE = int(os.getenv('AUTH0_USER_CACHE_SIZE', 1024))
+AUTH0_USER_CACHE_TTL = int(os.getenv('AUTH0_USER_CACHE_TTL', 60))
+
 ROOT_URLCONF = 'hicomfbackend.urls'
 
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Local memory by default, set CACHE_BACKEND/CACHE_LOCATION to share it between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Cache holding the serialized profile resources (see mains.cache), and how
+# long (seconds) an entry outlives its last read if the profile never changes.
+RESPONSE_CACHE_ALIAS = os.getenv('RESPONSE_CACHE_ALIAS', 'default')
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
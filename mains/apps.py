@@ -5,4 +5,5 @@ class MainsConfig(AppConfig):
     name = 'mains'
 
     def ready(self):
+        import mains.checks
         import mains.signals
\ No newline at end of file
@@ -0,0 +1,161 @@
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db import transaction
+
+from auth0authorization.cache import is_process_local
+
+
+class ProfileResponseCache:
+    """
+    Caches the serialized data of read-mostly resources that belong to a
+    profile (the profile itself, its addresses, jobs, educations and albums).
+
+    Every profile has a version counter that is part of each cache key.
+    Writes to any of these resources bump the version (see `mains.signals`),
+    so stale entries are never read again and simply expire. Keys also hold
+    the scheme and host, since the data contains absolute URLs.
+
+    The backend is the `RESPONSE_CACHE_ALIAS` entry of `CACHES`.
+    """
+
+    key_prefix = 'responses:'
+
+    def __init__(self, alias=None, timeout=None):
+        self.alias = alias or getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+        self.timeout = timeout if timeout is not None else getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def version_key(self, profile_id):
+        return f'{self.key_prefix}profile:{profile_id}:version'
+
+    def version(self, profile_id, create=True):
+        """
+        Returns the current version of `profile_id`, starting a new counter if
+        there is none (or returning None, unless `create` is set).
+        """
+        key = self.version_key(profile_id)
+        version = self.backend.get(key)
+        if version is None and create:
+            # Start from the clock rather than 1, so an evicted counter
+            # can't come back to a version whose entries are still cached
+            self.backend.add(key, time.time_ns(), None)
+            version = self.backend.get(key, 0)
+        return version
+
+    def versions(self, profile_ids):
+        "Returns {profile id: version} for existing profiles, in one cache round trip."
+        keys = {self.version_key(profile_id): profile_id for profile_id in profile_ids}
+        found = self.backend.get_many(keys)
+        versions = {keys[key]: version for key, version in found.items()}
+        for profile_id in keys.values():
+            if profile_id not in versions:
+                versions[profile_id] = self.version(profile_id)
+        return versions
+
+    def bump(self, profile_id):
+        """
+        Invalidates every cached resource of `profile_id`, now and again once
+        the current transaction commits: a concurrent read in between still
+        sees the old rows and may cache them under the new version.
+        """
+        self._bump(profile_id)
+        transaction.on_commit(lambda: self._bump(profile_id))
+
+    def _bump(self, profile_id):
+        key = self.version_key(profile_id)
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            self.backend.set(key, time.time_ns(), None)
+
+    def forget(self, profile_id):
+        "Drops the counter of a deleted profile, so it no longer has a version (nor an ETag)."
+        key = self.version_key(profile_id)
+        self.backend.delete(key)
+        # A read before the commit may start a new counter
+        transaction.on_commit(lambda: self.backend.delete(key))
+
+    def get_or_set(self, request, profile_id, resource, build):
+        """
+        Returns the cached data of `resource` (e.g. `('job', 3)`) of the
+        profile, calling `build()` on a miss. Errors raised by `build` (404,
+        403) are never cached.
+        """
+        try:
+            profile_id = int(profile_id)
+        except (TypeError, ValueError):
+            return build()
+        version = self.version(profile_id, create=False)
+        if version is None:
+            # Only start a counter once `build` proved the profile exists.
+            # A write may land in between, so this first result isn't cached.
+            data = build()
+            self.version(profile_id)
+            return data
+        parts = ':'.join(str(part) for part in resource)
+        key = (f'{self.key_prefix}{request.scheme}://{request.get_host()}:'
+               f'profile:{profile_id}:v{version}:{parts}')
+        data = self.backend.get(key)
+        if data is None:
+            data = build()
+            self.backend.set(key, data, self.timeout)
+        return data
+
+
+class FriendIdCache:
+    """
+    Friend lists as tuples of user ids, keyed by username, in the shared
+    Django cache. `random.sample` picks from the tuple without copying it,
+    membership tests build a frozenset locally. The receivers in
+    `mains.signals` drop the lists of both sides whenever friendships change.
+
+    Those invalidations only reach other workers through a shared backend.
+    With a per-process one (the local memory default) entries live for
+    `local_timeout` seconds at most, so an unfriended user loses friend-only
+    access everywhere within seconds.
+    """
+
+    # v2: tuples instead of frozensets
+    key_prefix = 'friends:v2:'
+
+    def __init__(self, timeout=None, local_timeout=None):
+        self.timeout = timeout if timeout is not None else getattr(settings, 'FRIEND_CACHE_TIMEOUT', 3600)
+        self.local_timeout = local_timeout if local_timeout is not None else getattr(
+            settings, 'FRIEND_CACHE_LOCAL_TIMEOUT', 5)
+
+    def get_timeout(self):
+        if is_process_local(caches[DEFAULT_CACHE_ALIAS]):
+            return min(self.timeout, self.local_timeout)
+        return self.timeout
+
+    def get_sequence(self, username, loader):
+        "Returns the friend ids of `username` as a tuple, calling `loader(username)` on a miss."
+        key = self.key_prefix + username
+        ids = cache.get(key)
+        if ids is None:
+            ids = tuple(set(loader(username)))
+            cache.set(key, ids, self.get_timeout())
+        return ids
+
+    def get(self, username, loader):
+        "Returns the friend ids of `username` as a frozenset."
+        return frozenset(self.get_sequence(username, loader))
+
+    def invalidate(self, *usernames):
+        """
+        Drops the lists of `usernames` now, and again once the current
+        transaction commits: a concurrent read in between still sees the old
+        friendships and may cache them again.
+        """
+        keys = [self.key_prefix + username for username in usernames]
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+profile_responses = ProfileResponseCache()
+friend_ids_cache = FriendIdCache()
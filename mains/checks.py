@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_friend_graph_snapshot(app_configs, **kwargs):
+    "Production workers should share one friend graph snapshot, see `mains.graph`."
+    if settings.FRIEND_GRAPH_SNAPSHOT:
+        return []
+    return [Warning(
+        "FRIEND_GRAPH_SNAPSHOT is not set: every worker rebuilds the friend graph from "
+        "the database and only sees friendship changes made through itself.",
+        hint="Point FRIEND_GRAPH_SNAPSHOT at a file refreshed by `manage.py build_friend_graph`.",
+        id='mains.W001',
+    )]
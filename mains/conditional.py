@@ -0,0 +1,100 @@
+"""
+ETag functions for conditional GETs (`django.views.decorators.http.condition`).
+
+Each one derives a strong validator from row versions or timestamps in one
+small indexed query (or none at all), so answering an unchanged resource
+with `304 Not Modified` never loads the full rows nor serializes them.
+Returning None (e.g. for a missing row) lets the view answer normally.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from rest_framework.exceptions import NotFound
+
+from mains.cache import profile_responses
+from mains.models import Comment, Photo, Post
+from mains.pagination import KeysetPagination
+
+
+def conditional(etag_func, **cache_kwargs):
+    """
+    Decorates an APIView method with ETag/304 handling and a `Cache-Control`
+    policy (`cache_control` arguments, e.g. `no_cache=True`).
+    """
+    def decorator(method):
+        return method_decorator(cache_control(**cache_kwargs))(
+            method_decorator(condition(etag_func=etag_func))(method))
+    return decorator
+
+
+def first_row(queryset):
+    try:
+        return queryset.first()
+    except (ValueError, ValidationError):
+        return None
+
+
+def profile_etag(request, pk=None, profile_pk=None, **kwargs):
+    """
+    Any profile resource: the profile version bumped on every write (no query).
+    Versions only exist for profiles known to exist, see `ProfileResponseCache`.
+    """
+    try:
+        profile_id = int(pk if profile_pk is None else profile_pk)
+    except (TypeError, ValueError):
+        return None
+    version = profile_responses.version(profile_id, create=False)
+    if version is None:
+        return None
+    return f'profile-{profile_id}-{version}'
+
+
+def post_etag(request, pk):
+    "Post edits move `time`, reactions and photos bump `revision`."
+    row = first_row(Post.objects.filter(pk=pk).values_list('time', 'revision'))
+    if row is None:
+        return None
+    time, revision = row
+    return f'post-{pk}-{time.timestamp()}-{revision}'
+
+
+def comment_list_etag(request, post_pk):
+    """
+    A page of comments: the ids and times (edits move `time`) of its comments,
+    where the next page starts, and the profile versions of their authors,
+    bumped by renames and avatar changes. One query for the page only, on the
+    (post, time, id) index, however many comments the post has.
+    """
+    ordering = Comment.ORDERINGS.get(request.query_params.get('order', 'oldest'))
+    if ordering is None:
+        return None
+    paginator = KeysetPagination(ordering=ordering)
+    try:
+        comments = paginator.paginate_queryset(Comment.objects.filter(post=post_pk).annotate(
+            profile_id=F('user__profile__id')).only('id', 'time'), request)
+    except (ValueError, ValidationError, NotFound):
+        return None
+    versions = profile_responses.versions(
+        {comment.profile_id for comment in comments if comment.profile_id is not None})
+    page = [(comment.id, comment.time.timestamp(), versions.get(comment.profile_id))
+            for comment in comments]
+    digest = hashlib.sha1(repr((page, paginator.next_position)).encode()).hexdigest()
+    return f'comments-{post_pk}-{digest}'
+
+
+def comment_etag(request, post_pk, comment_pk):
+    time = first_row(Comment.objects.filter(post=post_pk, pk=comment_pk).values_list('time', flat=True))
+    if time is None:
+        return None
+    return f'comment-{comment_pk}-{time.timestamp()}'
+
+
+def photo_etag(request, pk):
+    updated = first_row(Photo.objects.filter(pk=pk).values_list('updated', flat=True))
+    if updated is None:
+        return None
+    return f'photo-{pk}-{updated.timestamp()}'
@@ -0,0 +1,275 @@
+"""
+In-memory friendship graph for mutual friends and friend suggestions.
+
+The `friends` edge table is loaded into a compressed sparse row (CSR)
+structure of three int64 numpy arrays:
+
+    nodes      sorted user ids
+    offsets    neighbours of nodes[i] are neighbours[offsets[i]:offsets[i + 1]]
+    neighbours sorted user ids, per node
+
+Snapshots written by `FriendGraph.save` (see the `build_friend_graph`
+command) are memory-mapped read-only, so every worker of a host shares one
+copy through the page cache. Friendships made or broken since the snapshot
+(or build) are kept in a small per-process overlay fed by `mains.signals`:
+changes made through another worker only show up with the next snapshot.
+
+Production should set `FRIEND_GRAPH_SNAPSHOT` and run `build_friend_graph`
+periodically (the `mains.W001` deploy check warns otherwise). Without a
+snapshot every worker rebuilds its own graph from the whole edge table, in a
+background thread, every `FRIEND_GRAPH_REFRESH_INTERVAL` seconds.
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+MAGIC = b'HCFG'
+FORMAT_VERSION = 1
+# magic, format version, number of nodes, number of edge entries, build time
+HEADER = struct.Struct('<4sIqqd')
+ITEM_SIZE = 8
+
+
+class FriendGraph:
+
+    def __init__(self, nodes, offsets, neighbours, built_at):
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.neighbours = np.asarray(neighbours, dtype=np.int64)
+        self.built_at = built_at
+        self.source_mtime = None
+        self._mmap = None
+        # {user id: {friend id: (added, time)}} of changes newer than the snapshot
+        self._overlay = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_edges(cls, edges, built_at=None):
+        "Builds the graph from (user id, friend id) pairs, each friendship listed both ways."
+        adjacency = {}
+        for user_id, friend_id in edges:
+            adjacency.setdefault(user_id, set()).add(friend_id)
+        nodes = sorted(adjacency)
+        neighbours = [friend_id for user_id in nodes for friend_id in sorted(adjacency[user_id])]
+        offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum([len(adjacency[user_id]) for user_id in nodes], out=offsets[1:])
+        return cls(nodes, offsets, neighbours, time.time() if built_at is None else built_at)
+
+    @classmethod
+    def from_database(cls):
+        from mains.models import Friendship
+        built_at = time.time()
+        edges = Friendship.friends.through.objects.values_list(
+            'from_friendship__user__id', 'to_friendship__user__id').iterator()
+        return cls.from_edges(edges, built_at)
+
+    def save(self, path):
+        "Writes a snapshot to `path`, atomically replacing the previous one."
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as snapshot:
+            snapshot.write(HEADER.pack(
+                MAGIC, FORMAT_VERSION, len(self.nodes), len(self.neighbours), self.built_at))
+            for values in (self.nodes, self.offsets, self.neighbours):
+                snapshot.write(values.astype('<i8').tobytes())
+        # Workers keep reading the old file through their maps until they reload
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        "Memory-maps the snapshot at `path`."
+        with open(path, 'rb') as snapshot:
+            mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_nodes, num_entries, built_at = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            mapped.close()
+            raise ValueError(f'{path} is not a friend graph snapshot.')
+        arrays = []
+        offset = HEADER.size
+        for length in (num_nodes, num_nodes + 1, num_entries):
+            arrays.append(np.frombuffer(mapped, dtype='<i8', count=length, offset=offset))
+            offset += length * ITEM_SIZE
+        graph = cls(*arrays, built_at)
+        graph._mmap = mapped
+        return graph
+
+    # Incremental updates
+
+    def apply(self, user_id, friend_id, added, at=None):
+        "Records a friendship made (`added`) or broken after the snapshot was built."
+        at = time.time() if at is None else at
+        with self._lock:
+            self._overlay.setdefault(user_id, {})[friend_id] = (added, at)
+            self._overlay.setdefault(friend_id, {})[user_id] = (added, at)
+
+    def adopt_overlay(self, previous):
+        "Keeps the changes of `previous` that this (newer) graph may not include yet."
+        with previous._lock:
+            for user_id, changes in previous._overlay.items():
+                for friend_id, (added, at) in changes.items():
+                    if at >= self.built_at:
+                        self.apply(user_id, friend_id, added, at)
+
+    # Queries
+
+    def _snapshot_friends(self, user_id):
+        "Friends of `user_id` in the CSR arrays, as a read-only slice."
+        i = np.searchsorted(self.nodes, user_id)
+        if i < len(self.nodes) and self.nodes[i] == user_id:
+            return self.neighbours[self.offsets[i]:self.offsets[i + 1]]
+        return self.neighbours[:0]
+
+    def friends(self, user_id):
+        "Returns the set of friend ids of `user_id`."
+        friends = set(self._snapshot_friends(user_id).tolist())
+        if user_id in self._overlay:
+            with self._lock:
+                changes = [(friend_id, added) for friend_id, (added, _)
+                           in self._overlay[user_id].items()]
+            for friend_id, added in changes:
+                if added:
+                    friends.add(friend_id)
+                else:
+                    friends.discard(friend_id)
+        return friends
+
+    def degree(self, user_id):
+        return len(self.friends(user_id))
+
+    def are_friends(self, user_id, other_id):
+        return other_id in self.friends(user_id)
+
+    def mutual_friends(self, user_id, other_id):
+        return self.friends(user_id) & self.friends(other_id)
+
+    def mutual_count(self, user_id, other_id):
+        return len(self.mutual_friends(user_id, other_id))
+
+    def within_two(self, user_id, other_id):
+        "True if `other_id` is a friend or a friend of a friend of `user_id`."
+        friends = self.friends(user_id)
+        return other_id in friends or not friends.isdisjoint(self.friends(other_id))
+
+    def suggestions(self, user_id, limit=10, exclude=()):
+        """
+        Returns [(user id, mutual count)] of friends of friends who aren't
+        friends yet, most mutual friends first.
+
+        The friend lists of all friends are gathered from the CSR arrays in
+        one vectorized step and counted with `np.unique`, only friends with
+        overlay changes go through Python sets.
+        """
+        friends = self.friends(user_id)
+        if not friends:
+            return []
+        ids = np.fromiter(friends, dtype=np.int64, count=len(friends))
+        with self._lock:
+            changed = np.fromiter(self._overlay, dtype=np.int64, count=len(self._overlay))
+        stored = ids[~np.isin(ids, changed)]
+        # Neighbour slices of the stored friends, concatenated without a Python loop
+        i = np.searchsorted(self.nodes, stored)
+        in_range = i < len(self.nodes)
+        i = i[in_range]
+        i = i[self.nodes[i] == stored[in_range]]
+        starts, lengths = self.offsets[i], self.offsets[i + 1] - self.offsets[i]
+        shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        parts = [self.neighbours[shifts + np.arange(lengths.sum())]]
+        parts += [np.fromiter(self.friends(friend_id), dtype=np.int64)
+                  for friend_id in ids[np.isin(ids, changed)].tolist()]
+        candidates, counts = np.unique(np.concatenate(parts), return_counts=True)
+        dropped = np.fromiter({user_id, *friends, *exclude}, dtype=np.int64)
+        kept = ~np.isin(candidates, dropped)
+        candidates, counts = candidates[kept], counts[kept]
+        best = np.lexsort((candidates, -counts))[:limit]
+        return list(zip(candidates[best].tolist(), counts[best].tolist()))
+
+
+logger = logging.getLogger(__name__)
+
+_graph = None
+_checked_at = None
+_rebuilding = False
+_graph_lock = threading.Lock()
+
+
+def _snapshot_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def get_friend_graph():
+    """
+    Returns the graph of this process. Every `FRIEND_GRAPH_REFRESH_INTERVAL`
+    seconds it is reloaded from `FRIEND_GRAPH_SNAPSHOT` if the snapshot file
+    changed. Without a snapshot the graph is rebuilt from the database in a
+    background thread, requests keep reading the current graph (an empty one
+    until the first build completes) in the meantime.
+    """
+    global _graph, _checked_at, _rebuilding
+    now = time.monotonic()
+    if _graph is not None and now - _checked_at < settings.FRIEND_GRAPH_REFRESH_INTERVAL:
+        return _graph
+    with _graph_lock:
+        if _graph is not None and now - _checked_at < settings.FRIEND_GRAPH_REFRESH_INTERVAL:
+            return _graph
+        path = settings.FRIEND_GRAPH_SNAPSHOT
+        if path:
+            mtime = _snapshot_mtime(path)
+            if mtime is not None and (_graph is None or _graph.source_mtime != mtime):
+                graph = FriendGraph.load(path)
+                graph.source_mtime = mtime
+                if _graph is not None:
+                    graph.adopt_overlay(_graph)
+                _graph = graph
+        if _graph is None:
+            # Changes made until the first build are kept in its overlay
+            _graph = FriendGraph.from_edges(())
+        if _graph.source_mtime is None and not _rebuilding:
+            _rebuilding = True
+            threading.Thread(target=_rebuild_in_background, daemon=True).start()
+        _checked_at = now
+        return _graph
+
+
+def rebuild_friend_graph():
+    "Rebuilds the graph of this process from the database, keeping the newer changes of the current one."
+    global _graph, _checked_at
+    graph = FriendGraph.from_database()
+    with _graph_lock:
+        if _graph is not None:
+            graph.adopt_overlay(_graph)
+        _graph = graph
+        _checked_at = time.monotonic()
+    return graph
+
+
+def _rebuild_in_background():
+    global _rebuilding
+    try:
+        rebuild_friend_graph()
+    except Exception:
+        logger.exception("Unable to rebuild the friend graph.")
+    finally:
+        connection.close()
+        with _graph_lock:
+            _rebuilding = False
+
+
+def record_friendship_change(user_id, friend_id, added):
+    "Applies a friendship change to the graph of this process, if one is loaded."
+    if _graph is not None:
+        _graph.apply(user_id, friend_id, added)
+
+
+def reset_friend_graph():
+    global _graph, _checked_at
+    with _graph_lock:
+        _graph, _checked_at = None, None
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mains.graph import FriendGraph
+
+
+class Command(BaseCommand):
+    help = "Write a snapshot of the friendship graph for the workers to memory-map."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=settings.FRIEND_GRAPH_SNAPSHOT,
+            help="Snapshot path, FRIEND_GRAPH_SNAPSHOT by default.",
+        )
+
+    def handle(self, *args, **options):
+        path = options['output']
+        if not path:
+            raise CommandError("Set FRIEND_GRAPH_SNAPSHOT or pass --output.")
+        graph = FriendGraph.from_database()
+        graph.save(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(graph.nodes)} user(s), {len(graph.neighbours) // 2} friendship(s) written to {path}."))
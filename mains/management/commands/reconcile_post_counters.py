@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from mains.models import Post
+
+
+class Command(BaseCommand):
+    help = "Fix the like/comment/share counters of posts that drifted from the real row counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report the posts whose counters drifted.",
+        )
+
+    def handle(self, *args, **options):
+        real_counts = Post.objects.real_counts()
+        drift = Q()
+        for counter in Post.COUNTERS:
+            drift |= ~Q(**{counter: F(f'real_{counter}')})
+        drifted = Post.objects.annotate(**{
+            f'real_{counter}': expression for counter, expression in real_counts.items()
+        }).filter(drift).values_list('id', flat=True)
+
+        fixed = 0
+        for post_id in drifted.iterator():
+            if not options['dry_run']:
+                # Recount in the UPDATE itself so concurrent reactions are not lost,
+                # and move the revision so ETags of the post change with its counts
+                Post.objects.filter(pk=post_id).update(**real_counts, revision=F('revision') + 1)
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Post {post_id}")
+            fixed += 1
+
+        action = "drifted" if options['dry_run'] else "reconciled"
+        self.stdout.write(self.style.SUCCESS(f"{fixed} post(s) {action}."))
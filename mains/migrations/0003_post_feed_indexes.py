@@ -0,0 +1,26 @@
+# Generated by Django 3.1.1 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0002_photo_is_active'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='gender',
+            field=models.CharField(blank=True, choices=[('FEMALE', 'Female'), ('MALE', 'Male')], max_length=6),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-time', '-id'], name='post_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-time', '-id'], name='post_user_time_id_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.1.1 on 2026-10-18 08:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_reactions(apps, schema_editor):
+    Post = apps.get_model('mains', 'Post')
+
+    def count_of(model_name):
+        model = apps.get_model('mains', model_name)
+        return Coalesce(Subquery(
+            model.objects.filter(post=OuterRef('pk')).order_by().values('post')
+            .annotate(count=Count('id')).values('count')
+        ), 0)
+
+    Post.objects.update(
+        like_count=count_of('Like'),
+        comment_count=count_of('Comment'),
+        share_count=count_of('Share'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0004_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='share_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_reactions, migrations.RunPython.noop),
+    ]
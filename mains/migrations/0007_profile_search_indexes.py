@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# Columns of mains_profile searched by mains.search.search_profiles
+# (`user_id` holds the username).
+SEARCH_COLUMNS = ('first_name', 'last_name', 'user_id')
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        # GIN trigram indexes serve both ILIKE-style prefix filters on UPPER(column)
+        # and the pg_trgm `%` similarity operator.
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column in SEARCH_COLUMNS:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS mains_profile_{column}_trgm '
+                f'ON mains_profile USING gin (UPPER({column}::text) gin_trgm_ops)'
+            )
+    elif vendor == 'sqlite':
+        for column in SEARCH_COLUMNS:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS mains_profile_{column}_lower '
+                f'ON mains_profile (LOWER({column}))'
+            )
+
+
+def drop_search_indexes(apps, schema_editor):
+    suffix = {'postgresql': 'trgm', 'sqlite': 'lower'}.get(schema_editor.connection.vendor)
+    if suffix is None:
+        return
+    for column in SEARCH_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS mains_profile_{column}_{suffix}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0006_like_user_post_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.1 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0007_profile_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='revision',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.1 on 2026-10-18 08:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_friends(apps, schema_editor):
+    Friendship = apps.get_model('mains', 'Friendship')
+    through = Friendship.friends.through
+    Friendship.objects.update(num_friends=Coalesce(Subquery(
+        through.objects.filter(from_friendship=OuterRef('pk')).order_by().values('from_friendship')
+        .annotate(count=Count('id')).values('count')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0008_post_revision_photo_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='friendship',
+            name='num_friends',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_friends, migrations.RunPython.noop),
+    ]
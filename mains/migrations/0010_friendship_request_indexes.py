@@ -0,0 +1,35 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:00
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicate_requests(apps, schema_editor):
+    "Keep the oldest request of each (from_user, to_user) pair."
+    FriendshipRequest = apps.get_model('mains', 'FriendshipRequest')
+    first_ids = FriendshipRequest.objects.values('from_user', 'to_user').order_by().annotate(
+        first_id=Min('id')).values('first_id')
+    FriendshipRequest.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0009_friendship_num_friends'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendshiprequest',
+            index=models.Index(fields=['to_user', '-created', '-id'], name='request_to_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendshiprequest',
+            index=models.Index(fields=['from_user', '-created', '-id'], name='request_from_created_idx'),
+        ),
+        migrations.RunPython(drop_duplicate_requests, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friendshiprequest',
+            constraint=models.UniqueConstraint(fields=('from_user', 'to_user'), name='unique_friendship_request'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0010_friendship_request_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['album', '-id'], name='photo_album_id_idx'),
+        ),
+    ]
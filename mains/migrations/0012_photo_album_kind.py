@@ -0,0 +1,44 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:04
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def set_album_kinds(apps, schema_editor):
+    "Albums were told apart by name."
+    PhotoAlbum = apps.get_model('mains', 'PhotoAlbum')
+    PhotoAlbum.objects.filter(name='avatar').update(kind='A')
+    PhotoAlbum.objects.filter(name='postPhoto').update(kind='P')
+
+
+def keep_latest_active_photo(apps, schema_editor):
+    "Nothing prevented several active photos per album, keep the latest one."
+    Photo = apps.get_model('mains', 'Photo')
+    latest_ids = Photo.objects.filter(is_active=True).values('album').order_by().annotate(
+        latest_id=Max('id')).values('latest_id')
+    Photo.objects.filter(is_active=True).exclude(id__in=latest_ids).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0011_photo_album_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photoalbum',
+            name='kind',
+            field=models.CharField(choices=[('A', 'Avatar'), ('P', 'Post photos'), ('C', 'Custom')], default='C', max_length=2),
+        ),
+        migrations.RunPython(set_album_kinds, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='photoalbum',
+            index=models.Index(fields=['profile', 'kind'], name='album_profile_kind_idx'),
+        ),
+        migrations.RunPython(keep_latest_active_photo, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='photo',
+            constraint=models.UniqueConstraint(condition=models.Q(is_active=True), fields=('album',), name='one_active_photo_per_album'),
+        ),
+    ]
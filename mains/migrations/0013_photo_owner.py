@@ -0,0 +1,57 @@
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def copy_owner(apps, schema_editor):
+    """
+    Photos belong to the author of their post. Before photo albums were per
+    profile, post photos went into one shared 'postPhoto' album, so the album
+    profile is only a fallback.
+    """
+    Photo = apps.get_model('mains', 'Photo')
+    PhotoAlbum = apps.get_model('mains', 'PhotoAlbum')
+    Post = apps.get_model('mains', 'Post')
+    Photo.objects.update(owner=Coalesce(
+        Subquery(Post.objects.filter(pk=OuterRef('post')).values('user__profile')[:1]),
+        Subquery(PhotoAlbum.objects.filter(pk=OuterRef('album')).values('profile')[:1]),
+    ))
+
+
+def rehome_post_photos(apps, schema_editor):
+    "Move post photos filed in another profile's album to their owner's own one."
+    Photo = apps.get_model('mains', 'Photo')
+    PhotoAlbum = apps.get_model('mains', 'PhotoAlbum')
+    misfiled = Photo.objects.filter(album__kind='P').exclude(album__profile=F('owner'))
+    for owner_id in misfiled.values_list('owner', flat=True).distinct().order_by():
+        album = PhotoAlbum.objects.filter(profile=owner_id, kind='P').order_by('id').first()
+        if album is None:
+            album = PhotoAlbum.objects.create(profile_id=owner_id, kind='P', name='postPhoto')
+        misfiled.filter(owner=owner_id).update(album=album)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0012_photo_album_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='owner',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mains.profile'),
+        ),
+        migrations.RunPython(copy_owner, migrations.RunPython.noop),
+        migrations.RunPython(rehome_post_photos, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='photo',
+            name='owner',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mains.profile'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['owner', '-id'], name='photo_owner_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0013_photo_owner'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'time', 'id'], name='comment_post_time_id_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:20
+
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+import django.utils.timezone
+
+
+def date_shares_from_posts(apps, schema_editor):
+    """
+    When shares were made wasn't recorded, use the time of the shared post
+    rather than now, which would make every old share look recent to
+    `TimelineEntryManager.pull`.
+    """
+    Share = apps.get_model('mains', 'Share')
+    Post = apps.get_model('mains', 'Post')
+    Share.objects.update(time=Subquery(Post.objects.filter(pk=OuterRef('post')).values('time')[:1]))
+
+
+def drop_duplicate_entries(apps, schema_editor):
+    "Concurrent pulls could insert the same entry twice, keep the first one."
+    TimelineEntry = apps.get_model('mains', 'TimelineEntry')
+    first_ids = TimelineEntry.objects.values('owner', 'post', 'share').order_by().annotate(
+        first_id=Min('id')).values('first_id')
+    TimelineEntry.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0014_comment_post_time_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='share',
+            name='time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(date_shares_from_posts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='share',
+            index=models.Index(fields=['user', '-time'], name='share_user_time_idx'),
+        ),
+        migrations.RunPython(drop_duplicate_entries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('owner', 'post', 'share'), name='unique_timeline_share'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(condition=models.Q(share=None), fields=('owner', 'post'), name='unique_timeline_post'),
+        ),
+    ]
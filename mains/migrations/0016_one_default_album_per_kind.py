@@ -0,0 +1,39 @@
+# Generated by Django 3.1.1 on 2026-10-18 09:26
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_albums(apps, schema_editor):
+    """
+    Concurrent first uploads, and custom albums named 'avatar' or 'postPhoto'
+    (see 0012), left several avatar or post photo albums on some profiles.
+    Move their photos into the oldest one, which keeps only the latest active photo.
+    """
+    PhotoAlbum = apps.get_model('mains', 'PhotoAlbum')
+    Photo = apps.get_model('mains', 'Photo')
+    duplicates = PhotoAlbum.objects.exclude(kind='C').values('profile', 'kind').order_by().annotate(
+        count=Count('id'), first_id=Min('id')).filter(count__gt=1)
+    for row in duplicates:
+        albums = PhotoAlbum.objects.filter(profile=row['profile'], kind=row['kind'])
+        active = Photo.objects.filter(album__in=albums, is_active=True)
+        latest_id = active.order_by('-id').values_list('id', flat=True).first()
+        active.exclude(id=latest_id).update(is_active=False)
+        others = albums.exclude(id=row['first_id'])
+        Photo.objects.filter(album__in=others).update(album_id=row['first_id'])
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mains', '0015_timeline_unique_entries'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_albums, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='photoalbum',
+            constraint=models.UniqueConstraint(condition=models.Q(_negated=True, kind='C'), fields=('profile', 'kind'), name='one_default_album_per_kind'),
+        ),
+    ]
@@ -1,10 +1,20 @@
-from django.db import models
+import operator
+import random
+from datetime import timedelta
+from functools import reduce
+
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser, User
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from django.core.exceptions import ValidationError
 
+from .cache import friend_ids_cache
+from .graph import record_friendship_change
 from .signals import (
     friendship_request_created,
     friendship_request_declined,
@@ -69,12 +79,55 @@ class Address(models.Model):
         return f"{self.house_number}, {self.street}, {self.district}, {self.city}."
 
 
+# Use this manager to answer many friend requests at once
+class FriendshipRequestManager(models.Manager):
+    def _pending_to(self, user, ids):
+        requests = self.filter(to_user=user.username)
+        if ids is not None:
+            requests = requests.filter(pk__in=ids)
+        return requests
+
+    def accept_many(self, user, ids=None):
+        """
+        Accept the requests sent to `user` (all of them, or those in `ids`) in
+        one transaction and a fixed number of queries. Returns how many were accepted.
+        """
+        with transaction.atomic():
+            pending = list(self._pending_to(user, ids).select_for_update().values_list('pk', 'from_user'))
+            if pending:
+                Friendship.objects.befriend_many(user.username, [from_user for _, from_user in pending])
+                self.filter(pk__in=[pk for pk, _ in pending]).delete()
+        for _ in pending:
+            friendship_request_accepted.send(sender=self.model)
+        return len(pending)
+
+    def decline_many(self, user, ids=None):
+        "Decline the requests sent to `user` (all of them, or those in `ids`), returns how many."
+        declined, _ = self._pending_to(user, ids).delete()
+        for _ in range(declined):
+            friendship_request_declined.send(sender=self.model)
+        return declined
+
+
 class FriendshipRequest(models.Model):
     from_user = models.ForeignKey(User, related_name="invitations_from", on_delete=models.CASCADE, to_field='username')
     to_user = models.ForeignKey(User, related_name="invitations_to", on_delete=models.CASCADE, to_field='username')
     message = models.CharField(max_length=200, blank=True)
     created = models.DateTimeField(default=timezone.now, editable=False)
 
+    objects = FriendshipRequestManager()
+
+    class Meta:
+        constraints = [
+            # Duplicates are rejected by the index, see also `clean` for the reverse pair
+            models.UniqueConstraint(fields=['from_user', 'to_user'], name='unique_friendship_request'),
+        ]
+        indexes = [
+            # Keyset pagination of the inbox and outbox, and the pending count
+            models.Index(fields=['to_user', '-created', '-id'], name='request_to_created_idx'),
+            models.Index(fields=['from_user', '-created', '-id'], name='request_from_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.from_user} wants to be friends with {self.to_user}"
 
@@ -82,6 +135,11 @@ class FriendshipRequest(models.Model):
         "Raise error if request is sent to its owner"
         if not self.from_user != self.to_user:
             raise ValidationError("Request must be sent to another user.")
+        if self._state.adding and Friendship.objects.are_friends(self.from_user, self.to_user):
+            raise ValidationError("These users are already friends.")
+        if self._state.adding and FriendshipRequest.objects.filter(
+                from_user=self.to_user_id, to_user=self.from_user_id).exists():
+            raise ValidationError("This user already sent you a friend request.")
     
     # Call this method before trying to add data, overriding the default behavior of built-in `save`
     def save(self, *args, **kwargs):
@@ -93,7 +151,7 @@ class FriendshipRequest(models.Model):
 
     def accept(self):
         "Accept friend request, add friendship between two user"
-        Friendship.objects.befriend(self.from_user, self.to_user)
+        Friendship.objects.befriend_many(self.to_user_id, [self.from_user_id])
 
         friendship_request_accepted.send(sender=self.__class__)
         
@@ -116,13 +174,108 @@ class FriendshipRequest(models.Model):
 # Use this manager to add extra methods for Friendship model ("table-level")
 class FriendshipManager(models.Manager):
     def friends_of(self, user, shuffle=False):
+        # `shuffle` sorts every friend randomly, use `sample_friends` to pick a few
         query_set = User.objects.filter(friendship__friends__user=user)
         if shuffle:
             query_set = query_set.order_by('?')
         return query_set
 
+    def friend_ids(self, user):
+        """
+        Returns the frozenset of user ids of the friends of `user`, from the
+        friend list cache. No query once cached, but every call fetches and
+        unpickles the whole list: O(friends), call it once per request.
+        """
+        return friend_ids_cache.get(user.username, self._load_friend_ids)
+
+    def _load_friend_ids(self, username):
+        return Friendship.friends.through.objects.filter(
+            from_friendship__user=username
+        ).values_list('to_friendship__user__id', flat=True)
+
+    def sample_friends(self, user, k):
+        """
+        Returns up to `k` random friends of `user`, in random order, with their
+        profile loaded and `avatar` set. Picks from the cached friend ids, so
+        only the sampled users are read from the database.
+        """
+        ids = friend_ids_cache.get_sequence(user.username, self._load_friend_ids)
+        picked = random.sample(ids, min(k, len(ids)))
+        users = User.objects.filter(id__in=picked).select_related('profile').in_bulk()
+        profiles = [user.profile for user in users.values() if hasattr(user, 'profile')]
+        avatars = Photo.objects.active_avatars(profiles)
+        friends = []
+        for user_id in picked:
+            friend = users.get(user_id)
+            if friend is None:
+                continue
+            profile = getattr(friend, 'profile', None)
+            friend.avatar = avatars.get(profile.id) if profile else None
+            friends.append(friend)
+        return friends
+
     def are_friends(self, user1, user2):
-        return bool(Friendship.objects.get(user=user1).friends.filter(user=user2).exists())
+        """
+        Membership test on the cached friend ids of `user1`: no query once
+        cached, O(friends of `user1`) to load the list. Use `are_friends_many`
+        to test several users against the same list.
+        """
+        return user2.id in self.friend_ids(user1)
+
+    def are_friends_many(self, viewer, users):
+        """
+        Returns {user id: is a friend of `viewer`} for `users` (instances or
+        ids), e.g. a feed page, loading the friend list of `viewer` once.
+        """
+        friend_ids = self.friend_ids(viewer)
+        return {user_id: user_id in friend_ids for user_id in (getattr(user, 'pk', user) for user in users)}
+
+    def befriend_many(self, username, friend_usernames):
+        """
+        Make the user `username` friends with every user of `friend_usernames`
+        in a fixed number of queries, creating missing Friendship rows.
+        Returns the number of new friendships.
+        """
+        usernames = {username, *friend_usernames}
+        existing = set(self.filter(user__in=usernames).values_list('user_id', flat=True))
+        self.bulk_create([Friendship(user_id=name) for name in usernames - existing])
+        pks = dict(self.filter(user__in=usernames).values_list('user_id', 'pk'))
+        mine = pks.pop(username)
+        through = Friendship.friends.through
+        already = set(through.objects.filter(
+            from_friendship=mine, to_friendship__in=pks.values()
+        ).values_list('to_friendship', flat=True))
+        new = set(pks.values()) - already
+        through.objects.bulk_create([
+            through(from_friendship_id=a, to_friendship_id=b)
+            for friend in new for a, b in ((mine, friend), (friend, mine))
+        ])
+        self.record_changes(mine, new, added=True)
+        return len(new)
+
+    def record_changes(self, friendship_pk, friend_pks, added):
+        """
+        Bookkeeping after friendships between `friendship_pk` and `friend_pks`
+        (Friendship pks) were made or broken: the friend counters, the cached
+        friend ids (dropped again on commit) and, once committed, the friend
+        graph of this process.
+        """
+        friend_pks = set(friend_pks)
+        if not friend_pks:
+            return
+        delta = 1 if added else -1
+        self.filter(pk=friendship_pk).update(num_friends=F('num_friends') + delta * len(friend_pks))
+        self.filter(pk__in=friend_pks).update(num_friends=F('num_friends') + delta)
+        rows = list(self.filter(pk__in=friend_pks | {friendship_pk}).values_list('pk', 'user_id', 'user__id'))
+        friend_ids_cache.invalidate(*(username for _, username, _ in rows))
+        user_id = next((user_id for pk, _, user_id in rows if pk == friendship_pk), None)
+        friend_user_ids = [user_id for pk, _, user_id in rows if pk != friendship_pk]
+
+        def record():
+            for friend_user_id in friend_user_ids:
+                record_friendship_change(user_id, friend_user_id, added)
+        if user_id is not None:
+            transaction.on_commit(record)
 
     def befriend(self, user1, user2):
         Friendship.objects.get(user=user1).friends.add(Friendship.objects.get(user=user2))
@@ -131,6 +284,7 @@ class FriendshipManager(models.Manager):
 
     def unfriend(self, user1, user2):
         Friendship.objects.get(user=user1).friends.remove(Friendship.objects.get(user=user2))
+        TimelineEntry.objects.forget(user1, user2)
 
         # FriendshipRequest.objects.filter(from_user=user1, to_user=user2).delete()
         # FriendshipRequest.objects.filter(from_user=user2, to_user=user1).delete()
@@ -140,10 +294,13 @@ class Friendship(models.Model):
     user = models.OneToOneField(User, related_name='friendship', on_delete=models.CASCADE, to_field='username')
     friends = models.ManyToManyField('self')
 
+    # Maintained with F() expressions by FriendshipManager.record_changes
+    num_friends = models.IntegerField(default=0, editable=False)
+
     objects = FriendshipManager()
 
     def friend_count(self):
-        return self.friends.count()
+        return self.num_friends
 
 
 class Job(models.Model):
@@ -236,40 +393,179 @@ class Education(models.Model):
         super().save(*args, **kwargs)
 
 
+# Use this manager to list albums without loading their photos
+class PhotoAlbumManager(models.Manager):
+    # The active photo (avatars) is the cover, the latest photo otherwise
+    COVER_ORDER = (F('is_active').desc(nulls_last=True), '-id')
+
+    def with_stats(self):
+        "Albums annotated with `photo_count` and `cover_url`, in a single query."
+        photos = Photo.objects.filter(album=OuterRef('pk')).order_by()
+        return self.annotate(
+            photo_count=Coalesce(Subquery(
+                photos.values('album').annotate(count=Count('id')).values('count')
+            ), 0),
+            cover_url=Subquery(photos.order_by(*self.COVER_ORDER).values('photo_url')[:1]),
+        )
+
+
 class PhotoAlbum(models.Model):
     name = models.CharField(max_length=50)
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='albums')
 
+    class Kind(models.TextChoices):
+        AVATAR = 'A', _('Avatar')
+        POST_PHOTOS = 'P', _('Post photos')
+        CUSTOM = 'C', _('Custom')
+
+    kind = models.CharField(
+        max_length=2,
+        choices=Kind.choices,
+        default=Kind.CUSTOM,
+    )
+
+    objects = PhotoAlbumManager()
+
+    class Meta:
+        constraints = [
+            # One avatar and one post photos album per profile, `get_or_create`
+            # of a concurrent first upload then finds the album of the other one
+            models.UniqueConstraint(fields=['profile', 'kind'], condition=~Q(kind='C'),
+                                    name='one_default_album_per_kind'),
+        ]
+        indexes = [
+            # Avatar and post photo albums of a profile
+            models.Index(fields=['profile', 'kind'], name='album_profile_kind_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} album - with {self.num_photos} photos."
     
     @property
     def num_photos(self):
-        return len(Photo.objects.filter(album=self))
+        # Annotated by PhotoAlbum.objects.with_stats()
+        if hasattr(self, 'photo_count'):
+            return self.photo_count
+        return self.photos.count()
+
+    @property
+    def cover(self):
+        "Url of the cover photo, None for an empty album."
+        if hasattr(self, 'cover_url'):
+            return self.cover_url
+        return self.photos.order_by(*PhotoAlbum.objects.COVER_ORDER).values_list(
+            'photo_url', flat=True).first()
+
+
+# Use this manager to maintain the denormalized reaction counters of posts
+class PostManager(models.Manager):
+    def add_to_counter(self, post_id, counter, delta):
+        "Atomically add `delta` to one of `Post.COUNTERS` in the database."
+        return self.filter(pk=post_id).update(**{counter: F(counter) + delta, 'revision': F('revision') + 1})
+
+    def touch(self, post_id):
+        "Bump the revision of a post whose related rows (e.g. photos) changed."
+        return self.filter(pk=post_id).update(revision=F('revision') + 1)
+
+    def attach_previews(self, posts, size):
+        """
+        Set `post.previews` to {'likes'|'comments'|'shares': [first `size` ids]}
+        for a page of posts, with one query per relation.
+        """
+        for relation, model, counter in (('likes', Like, 'like_count'),
+                                         ('comments', Comment, 'comment_count'),
+                                         ('shares', Share, 'share_count')):
+            previews = {post.id: [] for post in posts}
+            # Each post contributes a LIMITed subquery on the (post, id) index
+            firsts = [
+                Q(id__in=model.objects.filter(post=post.id).order_by('id').values('id')[:size])
+                for post in posts if getattr(post, counter)
+            ]
+            if firsts:
+                rows = model.objects.filter(reduce(operator.or_, firsts)).order_by('id')
+                for reaction_id, post_id in rows.values_list('id', 'post_id'):
+                    previews[post_id].append(reaction_id)
+            for post in posts:
+                if not hasattr(post, 'previews'):
+                    post.previews = {}
+                post.previews[relation] = previews[post.id]
+
+    def real_counts(self):
+        "Returns {counter: expression} counting the likes, comments and shares rows of each post."
+        def count_of(model):
+            return Coalesce(Subquery(
+                model.objects.filter(post=OuterRef('pk')).order_by().values('post')
+                .annotate(count=Count('id')).values('count')
+            ), 0)
+        return {
+            'like_count': count_of(Like),
+            'comment_count': count_of(Comment),
+            'share_count': count_of(Share),
+        }
 
 
 class Post(models.Model):
     caption = models.TextField(blank=True)
     time = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
-    
+    like_count = models.IntegerField(default=0, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+    share_count = models.IntegerField(default=0, editable=False)
+    # Bumped whenever reactions or photos change, part of the post ETag
+    revision = models.IntegerField(default=0, editable=False)
+
+    # Only ever written with F() expressions (see PostManager.add_to_counter)
+    COUNTERS = ('like_count', 'comment_count', 'share_count')
+
+    objects = PostManager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the feed, globally and per user
+            models.Index(fields=['-time', '-id'], name='post_time_id_idx'),
+            models.Index(fields=['user', '-time', '-id'], name='post_user_time_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Saving a loaded post must not overwrite counters (or the revision) updated concurrently
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTERS + ('revision',)
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def num_likes(self):
-        return len(Like.objects.filter(post=self))
+        return self.like_count
 
     @property
     def num_comments(self):
-        return len(Comment.objects.filter(post=self))
+        return self.comment_count
 
     @property
     def num_shares(self):
-        return len(Share.objects.filter(post=self))
+        return self.share_count
+
+
+class LikeManager(models.Manager):
+    def liked_ids(self, user, post_ids):
+        "Returns {post id: like id} for the posts among `post_ids` that `user` liked."
+        return dict(self.filter(user=user, post__in=post_ids).values_list('post_id', 'id'))
 
 
 class Like(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes', verbose_name="by user")
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
 
+    objects = LikeManager()
+
+    class Meta:
+        indexes = [
+            # "Has the viewer liked these posts" lookups
+            models.Index(fields=['user', 'post'], name='like_user_post_idx'),
+        ]
+
     def __str__(self):
         return f"This like is created by {self.user.profile.full_name} in post (id: {self.post.id})"
 
@@ -280,6 +576,18 @@ class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments', verbose_name="by user")
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
 
+    # Orderings of the comment pages of a post, by `?order=`
+    ORDERINGS = {
+        'oldest': ('time', 'id'),
+        'newest': ('-time', '-id'),
+    }
+
+    class Meta:
+        indexes = [
+            # Comment pages of a post, oldest or newest first
+            models.Index(fields=['post', 'time', 'id'], name='comment_post_time_id_idx'),
+        ]
+
     def __str__(self):
         return f"This comment is created by {self.user.profile.full_name} in post (id: {self.post.id})"
 
@@ -287,16 +595,154 @@ class Comment(models.Model):
 class Share(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shares', verbose_name="by user")
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='shares')
+    time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Recent shares of users too popular to fan out, see `TimelineEntryManager.pull`
+            models.Index(fields=['user', '-time'], name='share_user_time_idx'),
+        ]
 
     def __str__(self):
         return f"This share is created by {self.user.profile.full_name} in post (id: {self.post.id}"
 
 
+class PhotoManager(models.Manager):
+    def active_avatars(self, profiles):
+        "Returns {profile id: active avatar url} for a batch of profiles (or ids) in one query."
+        return dict(self.filter(
+            album__kind=PhotoAlbum.Kind.AVATAR, album__profile__in=profiles, is_active=True
+        ).values_list('album__profile_id', 'photo_url'))
+
+    def set_avatar(self, profile, photo_url):
+        """
+        Make `photo_url` the active avatar of `profile`, posted like every
+        avatar change. The old avatar is deactivated in the same transaction,
+        and the locked album row serializes concurrent changes, so
+        `one_active_photo_per_album` never sees two active avatars. Before the
+        album exists there is nothing to lock: `one_default_album_per_kind`
+        makes a concurrent first upload reuse the album created by the other.
+        """
+        with transaction.atomic():
+            album, _ = PhotoAlbum.objects.select_for_update().get_or_create(
+                profile=profile, kind=PhotoAlbum.Kind.AVATAR, defaults={'name': 'avatar'})
+            post = Post.objects.create(
+                caption=f"{profile.full_name} has updated his avatar",
+                user=profile.user
+            )
+            self.filter(album=album, is_active=True).update(is_active=False, updated=timezone.now())
+            return self.create(photo_url=photo_url, album=album, post=post, owner=profile, is_active=True)
+
+
 class Photo(models.Model):
     photo_url = models.TextField()
     album = models.ForeignKey(PhotoAlbum, on_delete=models.CASCADE, related_name="photos")
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="photos")
     is_active = models.BooleanField(null=True)
+    updated = models.DateTimeField(auto_now=True)
+    # Profile of the post author, copied here so profile photo streams need no join
+    owner = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='+', editable=False)
+
+    objects = PhotoManager()
+
+    class Meta:
+        constraints = [
+            # The active avatar, found with a single index lookup
+            models.UniqueConstraint(fields=['album'], condition=Q(is_active=True),
+                                    name='one_active_photo_per_album'),
+        ]
+        indexes = [
+            # Keyset pagination of album photo grids
+            models.Index(fields=['album', '-id'], name='photo_album_id_idx'),
+            # Keyset pagination of profile photo streams
+            models.Index(fields=['owner', '-id'], name='photo_owner_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Photo {self.id} belong to {self.album.name}"
+
+    def save(self, *args, **kwargs):
+        if self.owner_id is None:
+            self.owner_id = Profile.objects.filter(user__posts=self.post_id).values_list(
+                'id', flat=True).first() or self.album.profile_id
+        super().save(*args, **kwargs)
+
+
+# Use this manager to build the materialized home timelines
+class TimelineEntryManager(models.Manager):
+    def heavy_users(self, users):
+        """
+        Returns the ids of `users` with more friends than `TIMELINE_FANOUT_LIMIT`,
+        their posts are pulled by readers instead of pushed to every friend.
+        """
+        return list(Friendship.objects.filter(
+            user__in=users, num_friends__gt=settings.TIMELINE_FANOUT_LIMIT
+        ).values_list('user__id', flat=True))
+
+    def fan_out(self, actor, post, share=None):
+        "Push a post (or a share of it) into the timelines of the actor and their friends."
+        readers = [actor.id]
+        if not self.heavy_users([actor]):
+            readers += Friendship.objects.friends_of(actor).values_list('id', flat=True)
+        self.bulk_create([
+            TimelineEntry(owner_id=reader, actor=actor, post=post, share=share,
+                          time=post.time if share is None else share.time)
+            for reader in readers
+        ], ignore_conflicts=True)
+
+    def pull(self, user):
+        """
+        Fan-out-on-read: materialize recent posts and shares of friends too popular
+        to fan out into the timeline of `user`, skipping the ones already there.
+        """
+        heavy = self.heavy_users(Friendship.objects.friends_of(user))
+        if not heavy:
+            return
+        since = timezone.now() - timedelta(days=settings.TIMELINE_PULL_WINDOW_DAYS)
+        pulled = self.filter(owner=user, actor__in=heavy, time__gte=since)
+        posts = Post.objects.filter(user__in=heavy, time__gte=since).exclude(
+            id__in=pulled.filter(share=None).values('post_id'))
+        shares = Share.objects.filter(user__in=heavy, time__gte=since).exclude(
+            id__in=pulled.exclude(share=None).values('share_id'))
+        entries = [
+            TimelineEntry(owner=user, actor_id=post.user_id, post=post, time=post.time)
+            for post in posts.only('id', 'user_id', 'time')
+        ]
+        entries += [
+            TimelineEntry(owner=user, actor_id=share.user_id, post_id=share.post_id,
+                          share=share, time=share.time)
+            for share in shares.only('id', 'user_id', 'post_id', 'time')
+        ]
+        # Concurrent first pages pull the same rows, the unique constraints drop the copies
+        self.bulk_create(entries, ignore_conflicts=True)
+
+    def forget(self, user1, user2):
+        "Remove what two former friends pushed into each other's timeline."
+        self.filter(owner=user1, actor=user2).delete()
+        self.filter(owner=user2, actor=user1).delete()
+
+
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    share = models.ForeignKey(Share, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    time = models.DateTimeField(default=timezone.now)
+
+    objects = TimelineEntryManager()
+
+    class Meta:
+        constraints = [
+            # Every post or share shows up once per timeline. NULLs never compare
+            # equal, so plain posts (no share) need their own partial index.
+            models.UniqueConstraint(fields=['owner', 'post', 'share'], name='unique_timeline_share'),
+            models.UniqueConstraint(fields=['owner', 'post'], condition=Q(share=None),
+                                    name='unique_timeline_post'),
+        ]
+        indexes = [
+            # A timeline page is one range scan over this index
+            models.Index(fields=['owner', '-time', '-id'], name='timeline_owner_time_id_idx'),
+        ]
 
     def __str__(self):
-        return f"Photo {self.id} belong to {self.album.name}"
\ No newline at end of file
+        return f"Post (id: {self.post_id}) in the timeline of {self.owner_id}"
@@ -0,0 +1,114 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over a unique `ordering`, e.g. `('-time', '-id')`.
+
+    The next page starts strictly after the last row of the current one, so
+    fetching any page is a single range scan on an index matching `ordering`,
+    however deep the client has scrolled. The cursor is an opaque base64
+    token holding the ordering values of that last row.
+    """
+    ordering = ('-id',)
+    page_size = getattr(settings, 'API_PAGE_SIZE', 20)
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        if page_size is not None:
+            self.page_size = page_size
+        self.next_position = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        results = list(queryset[:page_size + 1])
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_position = self.position_of(results[-1])
+        return results
+
+    def get_paginated_response(self, data, **extra):
+        "`extra` entries (e.g. a total `count`) are added in front of the page."
+        return Response({**extra, 'next': self.get_next_link(), 'results': data})
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def fields(self):
+        "Yields (model field, descending) for each ordering entry."
+        for name in self.ordering:
+            descending = name.startswith('-')
+            yield self.model._meta.get_field(name.lstrip('-')), descending
+
+    def position_of(self, obj):
+        return [field.value_to_string(obj) for field, _ in self.fields()]
+
+    def after(self, position):
+        """
+        Returns the filter selecting rows after `position`:
+        (a > x) OR (a = x AND b > y) OR ... with `<` for descending fields.
+        """
+        conditions = []
+        equal = {}
+        for (field, descending), value in zip(self.fields(), position):
+            lookup = 'lt' if descending else 'gt'
+            conditions.append(Q(**equal, **{f'{field.attname}__{lookup}': value}))
+            equal[field.attname] = value
+        return reduce(lambda a, b: a | b, conditions)
+
+    def encode_cursor(self, position):
+        return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode()))
+            fields = list(self.fields())
+            if not isinstance(position, list) or len(position) != len(fields):
+                raise ValueError
+            return [field.to_python(value) for (field, _), value in zip(fields, position)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class SearchPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination for ranked results, which have no stable keyset.
+    """
+    default_limit = KeysetPagination.page_size
+    max_limit = 100
@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from auth0authorization.claims import get_token_claims
+
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
@@ -21,4 +23,16 @@ class AllowPostOwnerDelete(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method == 'DELETE' and obj.post.user == request.user:
             return True
-        return False
\ No newline at end of file
+        return False
+
+
+class HasScope(permissions.BasePermission):
+    """
+    View level permission to only allow access tokens carrying every scope
+    listed in the view's `required_scopes`.
+    """
+    def has_permission(self, request, view):
+        claims = get_token_claims(request)
+        if claims is None:
+            return False
+        return claims.scopes.issuperset(getattr(view, 'required_scopes', ()))
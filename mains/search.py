@@ -0,0 +1,83 @@
+import operator
+from functools import reduce
+
+from django.db import connection
+from django.db.models import (
+    BooleanField, Case, FloatField, Func, IntegerField, Q, Value, When
+)
+from django.db.models.functions import Lower, Upper
+
+from mains.models import Profile
+
+# Columns matched by `search_profiles`, names first
+SEARCH_FIELDS = ('first_name', 'last_name', 'user__username')
+
+
+class Similarity(Func):
+    "pg_trgm similarity of two strings, between 0 and 1."
+    function = 'SIMILARITY'
+    output_field = FloatField()
+
+
+class TrigramMatch(Func):
+    "pg_trgm `%` operator (similarity above the threshold), served by GIN trigram indexes."
+    arg_joiner = ' %% '
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
+
+def any_of(conditions):
+    return reduce(operator.or_, conditions)
+
+
+def all_of(conditions):
+    return reduce(operator.and_, conditions)
+
+
+def search_profiles(query, max_terms=3):
+    """
+    Returns profiles whose first name, last name or username start with every
+    term of `query` (case-insensitive), best matches first.
+
+    On PostgreSQL the prefix filter and the ranking use the GIN trigram
+    indexes, and names merely similar to `query` match too. Other databases
+    compare `LOWER(column)` ranges, which their expression indexes serve.
+    """
+    terms = query.lower().split()[:max_terms]
+    if not terms:
+        return Profile.objects.none()
+
+    if connection.vendor == 'postgresql':
+        query = ' '.join(terms)
+        prefixes = all_of(
+            any_of(Q(**{f'{field}__istartswith': term}) for field in SEARCH_FIELDS)
+            for term in terms
+        )
+        # Trigrams are case-insensitive, UPPER() lets the `%` operator use the same indexes
+        similar = any_of(Q(TrigramMatch(Upper(field), Value(query))) for field in SEARCH_FIELDS)
+        rank = reduce(operator.add, (Similarity(field, Value(query)) for field in SEARCH_FIELDS))
+        return Profile.objects.filter(prefixes | similar).annotate(
+            rank=rank).order_by('-rank', 'id')
+
+    lowered = {field: 'lower_' + field.replace('__', '_') for field in SEARCH_FIELDS}
+    queryset = Profile.objects.annotate(**{
+        alias: Lower(field) for field, alias in lowered.items()
+    })
+
+    # Range comparisons (unlike LIKE ... ESCAPE) can use the LOWER() indexes
+    def starts_with(alias, term):
+        return Q(**{f'{alias}__gte': term, f'{alias}__lt': term + '\uffff'})
+
+    prefixes = all_of(
+        any_of(starts_with(alias, term) for alias in lowered.values())
+        for term in terms
+    )
+    first_name, last_name = lowered['first_name'], lowered['last_name']
+    term = terms[0]
+    rank = Case(
+        When(Q(**{first_name: term}) | Q(**{last_name: term}), then=Value(3)),
+        When(starts_with(first_name, term) | starts_with(last_name, term), then=Value(2)),
+        default=Value(1),
+        output_field=IntegerField(),
+    )
+    return queryset.filter(prefixes).annotate(rank=rank).order_by('-rank', 'id')
@@ -2,9 +2,9 @@ from django.db.models import fields
 from mains.models import (
     Profile, Address, Job, Education,
     PhotoAlbum, Photo,
-    Post, Like, Share, Comment
+    Post, Like, Share, Comment, FriendshipRequest
 )
-# from django.contrib.auth.models import User
+from django.contrib.auth.models import User
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 
@@ -14,7 +14,7 @@ class AddressHyperlink(serializers.HyperlinkedRelatedField):
 
     def get_url(self, obj, view_name, request, format):
         url_kwargs = {
-            'profile_pk': obj.profile.id,
+            'profile_pk': obj.profile_id,
             'address_pk': obj.id
         }
         return reverse(view_name, kwargs=url_kwargs, request=request, format=format)
@@ -25,7 +25,7 @@ class JobHyperlink(serializers.HyperlinkedRelatedField):
 
     def get_url(self, obj, view_name, request, format):
         url_kwargs = {
-            'profile_pk': obj.profile.id,
+            'profile_pk': obj.profile_id,
             'job_pk': obj.id
         }
         return reverse(view_name, kwargs=url_kwargs, request=request, format=format)
@@ -36,7 +36,7 @@ class EducationHyperlink(serializers.HyperlinkedRelatedField):
 
     def get_url(self, obj, view_name, request, format):
         url_kwargs = {
-            'profile_pk': obj.profile.id,
+            'profile_pk': obj.profile_id,
             'edu_pk': obj.id
         }
         return reverse(view_name, kwargs=url_kwargs, request=request, format=format)
@@ -47,7 +47,7 @@ class AlbumHyperlink(serializers.HyperlinkedRelatedField):
 
     def get_url(self, obj, view_name, request, format):
         url_kwargs = {
-            'profile_pk': obj.profile.id,
+            'profile_pk': obj.profile_id,
             'album_pk': obj.id
         }
         return reverse(view_name, kwargs=url_kwargs, request=request, format=format)
@@ -58,7 +58,7 @@ class LikeHyperlink(serializers.HyperlinkedRelatedField):
 
     def get_url(self, obj, view_name, request, format):
         url_kwargs = {
-            'post_pk': obj.post.id,
+            'post_pk': obj.post_id,
             'like_pk': obj.id
         }
         return reverse(view_name, kwargs=url_kwargs, request=request, format=format)
@@ -69,7 +69,7 @@ class CommentHyperlink(serializers.HyperlinkedRelatedField):
 
     def get_url(self, obj, view_name, request, format):
         url_kwargs = {
-            'post_pk': obj.post.id,
+            'post_pk': obj.post_id,
             'comment_pk': obj.id
         }
         return reverse(view_name, kwargs=url_kwargs, request=request, format=format)
@@ -80,7 +80,7 @@ class ShareHyperlink(serializers.HyperlinkedRelatedField):
 
     def get_url(self, obj, view_name, request, format):
         url_kwargs = {
-            'post_pk': obj.post.id,
+            'post_pk': obj.post_id,
             'share_pk': obj.id
         }
         return reverse(view_name, kwargs=url_kwargs, request=request, format=format)
@@ -99,10 +99,25 @@ class ProfileSerializer(serializers.HyperlinkedModelSerializer):
                   'email', 'phone_number', 'addresses', 'jobs', 'educations', 'albums']
 
 
+class ProfileCardSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Lightweight profile representation for people lists. The avatars of the
+    whole list are expected in `context['avatars']` ({profile id: url}).
+    """
+    avatar = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Profile
+        fields = ['url', 'id', 'full_name', 'avatar']
+
+    def get_avatar(self, obj):
+        return self.context.get('avatars', {}).get(obj.id)
+
+
 class AddressSerializer(serializers.HyperlinkedModelSerializer):
     profile = serializers.HyperlinkedRelatedField(
         view_name='profile-detail', read_only=True)
-    url = AddressHyperlink(read_only=True)
+    url = AddressHyperlink(read_only=True, source='*')
 
     class Meta:
         model = Address
@@ -113,7 +128,7 @@ class AddressSerializer(serializers.HyperlinkedModelSerializer):
 class JobSerializer(serializers.HyperlinkedModelSerializer):
     profile = serializers.HyperlinkedRelatedField(
         view_name='profile-detail', read_only=True)
-    url = JobHyperlink(read_only=True)
+    url = JobHyperlink(read_only=True, source='*')
     working_time = serializers.ListField(
         source='get_working_time', read_only=True)
 
@@ -126,7 +141,7 @@ class JobSerializer(serializers.HyperlinkedModelSerializer):
 class EducationSerializer(serializers.HyperlinkedModelSerializer):
     profile = serializers.HyperlinkedRelatedField(
         view_name='profile-detail', read_only=True)
-    url = EducationHyperlink(read_only=True)
+    url = EducationHyperlink(read_only=True, source='*')
 
     class Meta:
         model = Education
@@ -147,16 +162,88 @@ class PostSerializer(serializers.HyperlinkedModelSerializer):
                   'num_comments', 'num_shares', 'likes', 'comments', 'shares']
 
 
+class CompactPostSerializer(PostSerializer):
+    """
+    List representation of posts: the counters, the first `PREVIEW_SIZE` likes,
+    comments and shares, and links to the paginated sub-resources.
+    Views attach the previews of a whole page with `Post.objects.attach_previews`.
+    """
+    PREVIEW_SIZE = 3
+
+    likes = serializers.SerializerMethodField()
+    comments = serializers.SerializerMethodField()
+    shares = serializers.SerializerMethodField()
+    likes_url = serializers.SerializerMethodField()
+    comments_url = serializers.SerializerMethodField()
+    shares_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Post
+        fields = ['url', 'id', 'caption', 'time', 'photos', 'num_likes', 'num_comments', 'num_shares',
+                  'likes', 'comments', 'shares', 'likes_url', 'comments_url', 'shares_url']
+
+    def preview(self, obj, relation, view_name, lookup):
+        previews = getattr(obj, 'previews', None)
+        if previews is None:
+            ids = getattr(obj, relation).order_by('id').values_list('id', flat=True)[:self.PREVIEW_SIZE]
+        else:
+            ids = previews[relation]
+        request = self.context.get('request')
+        return [
+            reverse(view_name, kwargs={'post_pk': obj.id, lookup: pk}, request=request)
+            for pk in ids
+        ]
+
+    def get_likes(self, obj):
+        return self.preview(obj, 'likes', 'like-detail', 'like_pk')
+
+    def get_comments(self, obj):
+        return self.preview(obj, 'comments', 'comment-detail', 'comment_pk')
+
+    def get_shares(self, obj):
+        return self.preview(obj, 'shares', 'share-detail', 'share_pk')
+
+    def get_likes_url(self, obj):
+        return reverse('like-list', kwargs={'post_pk': obj.id}, request=self.context.get('request'))
+
+    def get_comments_url(self, obj):
+        return reverse('comment-list', kwargs={'post_pk': obj.id}, request=self.context.get('request'))
+
+    def get_shares_url(self, obj):
+        return reverse('share-list', kwargs={'post_pk': obj.id}, request=self.context.get('request'))
+
+
 class AlbumSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Albums without their photos, which are paginated at `photos_url`. Serialize
+    albums from `PhotoAlbum.objects.with_stats()` to get counts and covers
+    without extra queries.
+    """
     profile = serializers.HyperlinkedRelatedField(
         view_name='profile-detail', read_only=True)
-    photos = serializers.HyperlinkedRelatedField(
-        view_name='photo-detail', read_only=True, many=True)
-    url = AlbumHyperlink(read_only=True)
+    url = AlbumHyperlink(read_only=True, source='*')
+    photos_url = serializers.SerializerMethodField()
 
     class Meta:
         model = PhotoAlbum
-        fields = ['url', 'id', 'name', 'num_photos', 'photos', 'profile']
+        fields = ['url', 'id', 'name', 'kind', 'num_photos', 'cover', 'photos_url', 'profile']
+        read_only_fields = ['kind']
+
+    def get_photos_url(self, obj):
+        return reverse('album-photo-list', args=(obj.profile_id, obj.id), request=self.context.get('request'))
+
+
+class ProfileCompositeSerializer(ProfileSerializer):
+    """
+    Profile page in one response: the profile with its addresses, jobs,
+    educations and albums embedded. Prefetch these relations, the albums
+    from `PhotoAlbum.objects.with_stats()` (their photos aren't loaded), to
+    keep the query count constant.
+    """
+    addresses = AddressSerializer(read_only=True, many=True)
+    jobs = JobSerializer(read_only=True, many=True)
+    educations = EducationSerializer(read_only=True, many=True)
+    albums = AlbumSerializer(read_only=True, many=True)
 
 
 class PhotoSerializer(serializers.HyperlinkedModelSerializer):
@@ -171,7 +258,7 @@ class PhotoSerializer(serializers.HyperlinkedModelSerializer):
 class LikeSerializer(serializers.HyperlinkedModelSerializer):
     post = serializers.HyperlinkedRelatedField(
         view_name='post-detail', read_only=True)
-    url = LikeHyperlink(read_only=True)
+    url = LikeHyperlink(read_only=True, source='*')
 
     class Meta:
         model = Like
@@ -190,8 +277,34 @@ class CommentSerializer(serializers.HyperlinkedModelSerializer):
 class ShareSerializer(serializers.HyperlinkedModelSerializer):
     post = serializers.HyperlinkedRelatedField(
         view_name='post-detail', read_only=True)
-    url = ShareHyperlink(read_only=True)
+    url = ShareHyperlink(read_only=True, source='*')
 
     class Meta:
         model = Share
         fields = ['url', 'id', 'post']
+
+
+class UsernameField(serializers.SlugRelatedField):
+    """
+    User foreign keys to `username`: rendered from the raw column without
+    loading the user, written as a username.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(slug_field='username', **kwargs)
+
+    def use_pk_only_optimization(self):
+        return True
+
+    def to_representation(self, value):
+        return value.pk
+
+
+class FriendshipRequestSerializer(serializers.HyperlinkedModelSerializer):
+    from_user = UsernameField(read_only=True)
+    to_user = UsernameField(queryset=User.objects.all())
+
+    class Meta:
+        model = FriendshipRequest
+        fields = ['url', 'id', 'from_user', 'to_user', 'message', 'created']
+        extra_kwargs = {'url': {'view_name': 'friendship-request-detail'}}
@@ -1,8 +1,9 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver, Signal
 
 from django.contrib.auth.models import User
 import mains.models
+from mains.cache import friend_ids_cache, profile_responses
 
 # Defining signals
 friendship_request_created = Signal()
@@ -11,6 +12,96 @@ friendship_request_accepted = Signal()
 friendship_request_cancelled = Signal()
 
 
+@receiver(post_save, sender='mains.Post')
+def fan_out_post(sender, instance, created, **kwargs):
+    "Push new posts to the home timelines of the author's friends."
+    if created:
+        mains.models.TimelineEntry.objects.fan_out(instance.user, instance)
+
+
+@receiver(post_save, sender='mains.Share')
+def fan_out_share(sender, instance, created, **kwargs):
+    "Push new shares to the home timelines of the sharer's friends."
+    if created:
+        mains.models.TimelineEntry.objects.fan_out(instance.user, instance.post, share=instance)
+
+
+@receiver(post_save, sender='mains.Profile')
+def bump_profile_version(sender, instance, **kwargs):
+    "Drop the cached responses of a profile when it changes."
+    profile_responses.bump(instance.pk)
+
+
+@receiver(post_delete, sender='mains.Profile')
+def forget_profile_version(sender, instance, **kwargs):
+    "A deleted profile has no cached responses nor ETag anymore."
+    profile_responses.forget(instance.pk)
+
+
+@receiver(post_save, sender='mains.Address')
+@receiver(post_delete, sender='mains.Address')
+@receiver(post_save, sender='mains.Job')
+@receiver(post_delete, sender='mains.Job')
+@receiver(post_save, sender='mains.Education')
+@receiver(post_delete, sender='mains.Education')
+@receiver(post_save, sender='mains.PhotoAlbum')
+@receiver(post_delete, sender='mains.PhotoAlbum')
+def bump_owner_version(sender, instance, **kwargs):
+    "Drop the cached responses of the profile owning a changed resource."
+    profile_responses.bump(instance.profile_id)
+
+
+@receiver(post_save, sender='mains.Photo')
+@receiver(post_delete, sender='mains.Photo')
+def bump_album_owner_version(sender, instance, **kwargs):
+    "Albums show their photo count and cover, drop the cached responses of the owner."
+    profile_responses.bump(instance.owner_id)
+
+
+@receiver(post_save, sender='mains.Photo')
+@receiver(post_delete, sender='mains.Photo')
+def touch_photo_post(sender, instance, **kwargs):
+    "Posts list their photos, move the revision (and ETag) of the post."
+    mains.models.Post.objects.touch(instance.post_id)
+
+
+@receiver(m2m_changed, sender='mains.Friendship_friends')
+def friends_changed(sender, instance, action, model, pk_set, **kwargs):
+    "Keep counters, caches and the friend graph in line with `friends.add/remove/clear`."
+    through = model.friends.through
+    if action == 'post_add':
+        # Only the pks that were actually added
+        model.objects.record_changes(instance.pk, pk_set, added=True)
+    elif action == 'pre_remove':
+        instance._removed_friends = set(through.objects.filter(
+            from_friendship=instance, to_friendship__in=pk_set
+        ).values_list('to_friendship', flat=True))
+    elif action == 'pre_clear':
+        instance._removed_friends = set(instance.friends.values_list('pk', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        model.objects.record_changes(instance.pk, instance.__dict__.pop('_removed_friends', ()), added=False)
+
+
+@receiver(post_save, sender='mains.Friendship')
+def reset_friend_ids(sender, instance, created, **kwargs):
+    "New friendships start without friends."
+    if created:
+        friend_ids_cache.invalidate(instance.user_id)
+
+
+@receiver(pre_delete, sender='mains.Friendship')
+def collect_friends(sender, instance, **kwargs):
+    instance._removed_friends = set(instance.friends.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender='mains.Friendship')
+def forget_friendship(sender, instance, **kwargs):
+    "Deleted friendships leave the friend lists (and counts) of their friends."
+    friend_ids_cache.invalidate(instance.user_id)
+    mains.models.Friendship.objects.record_changes(
+        instance.pk, instance.__dict__.pop('_removed_friends', ()), added=False)
+
+
 # @receiver(post_save, sender=User)
 # def create_profile(sender, instance, created, **kwargs):
 #     if created:
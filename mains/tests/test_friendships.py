@@ -0,0 +1,176 @@
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from mains.cache import FriendIdCache, friend_ids_cache
+from mains.models import Friendship, FriendshipRequest
+from mains.tests.test_views import create_member
+
+
+class FriendshipApiTest(TestCase):
+
+    # Setup: u1 and u2 are friends, u3 is not
+    def setUp(self):
+        self.u1 = create_member("dungdev1")
+        self.u2 = create_member("1712371", first_name="Minh", avatar="u2.png")
+        self.u3 = create_member("1234", first_name="Lan")
+        for user in (self.u1, self.u2, self.u3):
+            Friendship.objects.create(user=user)
+        Friendship.objects.befriend(self.u1, self.u2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_friend_count_is_persisted(self):
+        Friendship.objects.befriend(self.u1, self.u3)
+        Friendship.objects.befriend(self.u1, self.u3)
+        self.assertEqual(Friendship.objects.get(user=self.u1).num_friends, 2)
+        Friendship.objects.unfriend(self.u1, self.u2)
+        Friendship.objects.unfriend(self.u1, self.u2)
+        self.assertEqual(Friendship.objects.get(user=self.u1).friend_count(), 1)
+        self.assertEqual(Friendship.objects.get(user=self.u2).friend_count(), 0)
+        self.u3.friendship.friends.clear()
+        self.assertEqual(Friendship.objects.get(user=self.u1).friend_count(), 0)
+
+    def test_process_local_friend_cache_is_short_lived(self):
+        # The test settings use the local memory backend
+        self.assertEqual(FriendIdCache(timeout=3600, local_timeout=5).get_timeout(), 5)
+        friend_ids_cache.invalidate('dungdev1')
+        with mock.patch('mains.cache.cache.set') as cache_set:
+            friend_ids_cache.get('dungdev1', lambda username: [self.u2.id])
+        self.assertEqual(cache_set.call_args[0][2], 5)
+
+    def test_friend_list(self):
+        response = self.client.get(f'/api/v1/profiles/{self.u1.profile.id}/friends/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual([(card['full_name'], card['avatar']) for card in response.data['results']],
+                         [("Minh Nguyen", "u2.png")])
+
+    def test_unfriend(self):
+        response = self.client.delete('/api/v1/user/friends/1712371/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Friendship.objects.are_friends(self.u1, self.u2))
+        response = self.client.delete('/api/v1/user/friends/1712371/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_send_and_accept_request(self):
+        response = self.client.post('/api/v1/friend-requests/', {'to_user': '1234', 'message': "hi"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['from_user'], 'dungdev1')
+        pk = response.data['id']
+        self.client.force_authenticate(self.u3)
+        self.assertEqual(self.client.get(f'/api/v1/friend-requests/{pk}/').status_code, 200)
+        response = self.client.post(f'/api/v1/friend-requests/{pk}/accept/')
+        self.assertEqual(response.data, {'accepted': 1})
+        self.assertTrue(Friendship.objects.are_friends(self.u3, self.u1))
+        self.assertEqual(Friendship.objects.get(user=self.u1).num_friends, 2)
+        response = self.client.post(f'/api/v1/friend-requests/{pk}/accept/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_requests(self):
+        response = self.client.post('/api/v1/friend-requests/', {'to_user': '1712371'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/friend-requests/', {'to_user': 'nobody'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cancel_and_decline(self):
+        sent = FriendshipRequest.objects.create(from_user=self.u1, to_user=self.u3)
+        response = self.client.delete(f'/api/v1/friend-requests/{sent.id}/')
+        self.assertEqual(response.status_code, 204)
+        received = FriendshipRequest.objects.create(from_user=self.u3, to_user=self.u1)
+        response = self.client.post(f'/api/v1/friend-requests/{received.id}/decline/')
+        self.assertEqual(response.data, {'declined': 1})
+        self.assertFalse(FriendshipRequest.objects.exists())
+
+    def test_bulk_accept_in_fixed_queries(self):
+        def inbox(size):
+            senders = [create_member(f"sender{size}-{i}") for i in range(size)]
+            for sender in senders:
+                FriendshipRequest.objects.create(from_user=sender, to_user=self.u1)
+            return senders
+
+        inbox(2)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.post('/api/v1/friend-requests/bulk/', {'action': 'accept'}, format='json')
+        self.assertEqual(response.data, {'accepted': 2})
+        senders = inbox(30)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post('/api/v1/friend-requests/bulk/', {'action': 'accept'}, format='json')
+        self.assertEqual(response.data, {'accepted': 30})
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Friendship.objects.get(user=self.u1).num_friends, 33)
+        self.assertTrue(Friendship.objects.are_friends(senders[-1], self.u1))
+        self.assertEqual(Friendship.objects.get(user=senders[0]).num_friends, 1)
+
+    def test_bulk_decline_selected(self):
+        requests = [FriendshipRequest.objects.create(from_user=create_member(f"s{i}"), to_user=self.u1)
+                    for i in range(3)]
+        response = self.client.post('/api/v1/friend-requests/bulk/', {
+            'action': 'decline', 'ids': [requests[0].id, requests[1].id]}, format='json')
+        self.assertEqual(response.data, {'declined': 2})
+        self.assertEqual(list(FriendshipRequest.objects.all()), [requests[2]])
+        response = self.client.post('/api/v1/friend-requests/bulk/', {'action': 'ignore'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class FriendshipRequestBoxTest(TestCase):
+
+    def setUp(self):
+        self.u1 = create_member("dungdev1")
+        self.senders = [create_member(f"sender{i}", first_name=f"S{i}", avatar=f"s{i}.png")
+                        for i in range(5)]
+        for sender in self.senders:
+            FriendshipRequest.objects.create(from_user=sender, to_user=self.u1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_inbox_pages(self):
+        names = []
+        url = '/api/v1/friend-requests/?page_size=2'
+        while url:
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            names += [(r['from_user'], r['profile']['avatar']) for r in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(names, [(f"sender{i}", f"s{i}.png") for i in reversed(range(5))])
+
+    def test_outbox(self):
+        self.client.force_authenticate(self.senders[0])
+        response = self.client.get('/api/v1/friend-requests/?box=outbox')
+        self.assertEqual([(r['to_user'], r['profile']['full_name']) for r in response.data['results']],
+                         [("dungdev1", "Dung Nguyen")])
+
+    def test_pending_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/friend-requests/count/')
+        self.assertEqual(response.data, {'count': 5})
+
+    def test_duplicates_are_rejected(self):
+        self.client.force_authenticate(self.senders[0])
+        response = self.client.post('/api/v1/friend-requests/', {'to_user': 'dungdev1'})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(self.u1)
+        response = self.client.post('/api/v1/friend-requests/', {'to_user': 'sender0'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FriendshipRequest.objects.count(), 5)
+
+
+class FriendCacheCommitTest(TransactionTestCase):
+
+    def setUp(self):
+        self.u1 = create_member("dungdev1")
+        self.u2 = create_member("1712371")
+        for user in (self.u1, self.u2):
+            Friendship.objects.create(user=user)
+        Friendship.objects.befriend(self.u1, self.u2)
+
+    def test_read_before_commit_is_not_kept(self):
+        with transaction.atomic():
+            Friendship.objects.unfriend(self.u1, self.u2)
+            # A concurrent request still sees the committed friendship and caches it
+            friend_ids_cache.get('dungdev1', lambda username: [self.u2.id])
+            self.assertTrue(Friendship.objects.are_friends(self.u1, self.u2))
+        self.assertFalse(Friendship.objects.are_friends(self.u1, self.u2))
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from mains import graph
+from mains.checks import check_friend_graph_snapshot
+from mains.graph import FriendGraph
+from mains.models import Friendship, FriendshipRequest
+from mains.tests.test_views import create_member
+
+
+def symmetric(pairs):
+    return [edge for a, b in pairs for edge in ((a, b), (b, a))]
+
+
+class FriendGraphTest(SimpleTestCase):
+
+    # 1 - 2, 1 - 3, 2 - 3, 2 - 4, 3 - 4, 4 - 5
+    def setUp(self):
+        self.graph = FriendGraph.from_edges(symmetric([(1, 2), (1, 3), (2, 3), (2, 4), (3, 4), (4, 5)]))
+
+    def test_queries(self):
+        self.assertEqual(self.graph.friends(4), {2, 3, 5})
+        self.assertEqual(self.graph.friends(42), set())
+        self.assertEqual(self.graph.mutual_count(1, 4), 2)
+        self.assertTrue(self.graph.within_two(1, 4))
+        self.assertFalse(self.graph.within_two(1, 5))
+        self.assertEqual(self.graph.suggestions(1), [(4, 2)])
+        self.assertEqual(self.graph.suggestions(5), [(2, 1), (3, 1)])
+        self.assertEqual(self.graph.suggestions(5, exclude=[2]), [(3, 1)])
+
+    def test_overlay(self):
+        self.graph.apply(1, 5, added=True)
+        self.graph.apply(2, 3, added=False)
+        self.assertEqual(self.graph.friends(5), {1, 4})
+        self.assertEqual(self.graph.mutual_count(1, 4), 3)
+        self.assertFalse(self.graph.are_friends(3, 2))
+
+    def test_snapshot_is_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'friends.graph')
+            self.graph.save(path)
+            loaded = FriendGraph.load(path)
+            self.assertEqual(list(loaded.nodes), [1, 2, 3, 4, 5])
+            self.assertEqual(loaded.suggestions(1), [(4, 2)])
+            self.assertEqual(loaded.built_at, self.graph.built_at)
+            del loaded
+
+
+class FriendGraphCheckTest(SimpleTestCase):
+
+    def test_deploy_check_wants_a_snapshot(self):
+        with override_settings(FRIEND_GRAPH_SNAPSHOT=''):
+            self.assertEqual([w.id for w in check_friend_graph_snapshot(None)], ['mains.W001'])
+        with override_settings(FRIEND_GRAPH_SNAPSHOT='/var/lib/hicomf/friends.graph'):
+            self.assertEqual(check_friend_graph_snapshot(None), [])
+
+
+class FriendGraphSyncTest(TransactionTestCase):
+
+    def setUp(self):
+        graph.reset_friend_graph()
+        self.addCleanup(graph.reset_friend_graph)
+        self.users = [create_member(name) for name in ("dungdev1", "1712371", "1234", "stranger")]
+        for user in self.users:
+            Friendship.objects.create(user=user)
+
+    def test_befriend_and_unfriend_update_loaded_graph(self):
+        u1, u2, u3, u4 = self.users
+        Friendship.objects.befriend(u1, u2)
+        friend_graph = graph.rebuild_friend_graph()
+        self.assertIs(graph.get_friend_graph(), friend_graph)
+        Friendship.objects.befriend(u2, u3)
+        self.assertEqual(friend_graph.suggestions(u1.id), [(u3.id, 1)])
+        Friendship.objects.unfriend(u1, u2)
+        self.assertEqual(friend_graph.friends(u2.id), {u3.id})
+        self.assertIs(graph.get_friend_graph(), friend_graph)
+
+    def test_database_build_runs_in_background(self):
+        u1, u2, u3, u4 = self.users
+        Friendship.objects.befriend(u1, u2)
+        with self.assertNumQueries(0):
+            self.assertEqual(graph.get_friend_graph().friends(u1.id), set())
+        for _ in range(100):
+            if not graph._rebuilding:
+                break
+            time.sleep(0.05)
+        self.assertEqual(graph.get_friend_graph().friends(u1.id), {u2.id})
+
+    def test_snapshot_reload_keeps_newer_changes(self):
+        u1, u2, u3, u4 = self.users
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'friends.graph')
+            with override_settings(FRIEND_GRAPH_SNAPSHOT=path, FRIEND_GRAPH_REFRESH_INTERVAL=0):
+                Friendship.objects.befriend(u1, u2)
+                call_command('build_friend_graph', stdout=StringIO())
+                self.assertEqual(graph.get_friend_graph().friends(u1.id), {u2.id})
+                Friendship.objects.befriend(u1, u3)
+                # Rebuilt before the new friendship was recorded
+                FriendGraph.from_edges(symmetric([(u1.id, u2.id)]), built_at=0).save(path)
+                os.utime(path, (1, 1))
+                self.assertEqual(graph.get_friend_graph().friends(u1.id), {u2.id, u3.id})
+
+
+class FriendSuggestionListTest(TestCase):
+
+    def setUp(self):
+        graph.reset_friend_graph()
+        self.addCleanup(graph.reset_friend_graph)
+        self.u1 = create_member("dungdev1")
+        self.u2 = create_member("1712371", avatar="u2.png")
+        self.u3 = create_member("1234", first_name="Lan", avatar="u3.png")
+        self.u4 = create_member("stranger", first_name="Minh")
+        for user in (self.u1, self.u2, self.u3, self.u4):
+            Friendship.objects.create(user=user)
+        Friendship.objects.befriend(self.u1, self.u2)
+        Friendship.objects.befriend(self.u2, self.u3)
+        Friendship.objects.befriend(self.u2, self.u4)
+        FriendshipRequest.objects.create(from_user=self.u4, to_user=self.u1)
+        graph.rebuild_friend_graph()
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_suggestions(self):
+        response = self.client.get('/api/v1/user/suggestions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(card['full_name'], card['mutual_friends'], card['avatar'])
+                          for card in response.data], [("Lan Nguyen", 1, "u3.png")])
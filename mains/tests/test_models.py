@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
 from django.contrib.auth.models import User
@@ -93,6 +94,16 @@ class FriendshipModelTest(TestCase):
         self.assertTrue(Friendship.objects.are_friends(u1, u3))
         self.assertFalse(Friendship.objects.are_friends(u3, u2))
 
+    def test_are_friends_many(self):
+        u1 = User.objects.get(username='dungdev1')
+        u2 = User.objects.get(username='1712371')
+        u3 = User.objects.get(username='1234')
+        self.assertEqual(Friendship.objects.are_friends_many(u2, [u1, u3, 42]),
+                         {u1.id: True, u3.id: False, 42: False})
+        with self.assertNumQueries(0):
+            self.assertTrue(Friendship.objects.are_friends(u2, u1))
+            self.assertFalse(Friendship.objects.are_friends(u2, u3))
+
     def test_unfriend(self):
         u1 = User.objects.get(username='dungdev1')
         u2 = User.objects.get(username='1712371')
@@ -101,6 +112,32 @@ class FriendshipModelTest(TestCase):
         Friendship.objects.unfriend(u1, u2)
         self.assertFalse(Friendship.objects.are_friends(u1, u2))
 
+    def test_sample_friends(self):
+        u1 = User.objects.get(username='dungdev1')
+        for username in ('1712371', '1234'):
+            Profile.objects.create(user=User.objects.get(username=username), first_name=username)
+        friends = Friendship.objects.sample_friends(u1, 5)
+        self.assertEqual({friend.username for friend in friends}, {'1712371', '1234'})
+        # Friend ids are cached, profiles and avatars come with the sample
+        with self.assertNumQueries(2):
+            friends = Friendship.objects.sample_friends(u1, 1)
+            self.assertEqual(len(friends), 1)
+            self.assertEqual(friends[0].profile.first_name, friends[0].username)
+            self.assertIsNone(friends[0].avatar)
+
+    def test_friend_ids_follow_changes(self):
+        u1 = User.objects.get(username='dungdev1')
+        u2 = User.objects.get(username='1712371')
+        u3 = User.objects.get(username='1234')
+        self.assertEqual(set(Friendship.objects.friend_ids(u2)), {u1.id})
+        Friendship.objects.unfriend(u1, u2)
+        self.assertEqual(set(Friendship.objects.friend_ids(u1)), {u3.id})
+        self.assertEqual(set(Friendship.objects.friend_ids(u2)), set())
+        Friendship.objects.befriend(u3, u2)
+        self.assertEqual(set(Friendship.objects.friend_ids(u2)), {u3.id})
+        u3.friendship.delete()
+        self.assertEqual(set(Friendship.objects.friend_ids(u1)), set())
+
 
 class FriendshipRequestModelTest(TestCase):
 
@@ -129,6 +166,13 @@ class FriendshipRequestModelTest(TestCase):
         self.assertFalse(Friendship.objects.are_friends(u1, u3))
         self.assertFalse(Friendship.objects.are_friends(u2, u3))
 
+    def test_request_between_friends(self):
+        u1 = User.objects.get(username='dungdev1')
+        u3 = User.objects.get(username='1234')
+        Friendship.objects.befriend(u1, u3)
+        with self.assertRaises(ValidationError):
+            FriendshipRequest.objects.create(from_user=u3, to_user=u1)
+
     def test_decline_request(self):
         u1 = User.objects.get(username='dungdev1')
         u2 = User.objects.get(username='1712371')
@@ -0,0 +1,69 @@
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from mains.models import Friendship, Post, Share, TimelineEntry
+from mains.tests.test_views import create_member
+
+
+class TimelineTest(TestCase):
+
+    # Setup: u1 - u2 and u1 - u3 are friends, u4 is a stranger
+    def setUp(self):
+        self.u1 = create_member("dungdev1")
+        self.u2 = create_member("1712371")
+        self.u3 = create_member("1234")
+        self.u4 = create_member("stranger")
+        for user in (self.u1, self.u2, self.u3, self.u4):
+            Friendship.objects.create(user=user)
+        Friendship.objects.befriend(self.u1, self.u2)
+        Friendship.objects.befriend(self.u1, self.u3)
+        self.client = APIClient()
+
+    def timeline(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/v1/timeline/')
+        self.assertEqual(response.status_code, 200)
+        return [(post['id'], post['shared_by'] is not None) for post in response.data['results']]
+
+    def test_post_is_pushed_to_friends(self):
+        post = Post.objects.create(caption="hello", user=self.u1)
+        for user in (self.u1, self.u2, self.u3):
+            self.assertEqual(self.timeline(user), [(post.id, False)])
+        self.assertEqual(self.timeline(self.u4), [])
+
+    def test_share_is_pushed_to_sharer_friends(self):
+        post = Post.objects.create(caption="hello", user=self.u4)
+        Share.objects.create(post=post, user=self.u2)
+        self.assertEqual(self.timeline(self.u1), [(post.id, True)])
+        self.assertEqual(self.timeline(self.u3), [])
+
+    def test_unfriend_forgets_entries(self):
+        Post.objects.create(caption="hello", user=self.u2)
+        Friendship.objects.unfriend(self.u1, self.u2)
+        self.assertEqual(self.timeline(self.u1), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_heavy_user_posts_are_pulled(self):
+        post = Post.objects.create(caption="hello", user=self.u1)
+        # u1 has two friends, nothing is pushed
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.u2).exists())
+        self.assertEqual(self.timeline(self.u2), [(post.id, False)])
+        # Pulling again doesn't duplicate the entry
+        self.assertEqual(self.timeline(self.u2), [(post.id, False)])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_heavy_user_shares_are_pulled(self):
+        post = Post.objects.create(caption="hello", user=self.u4)
+        Share.objects.create(post=post, user=self.u1)
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.u2).exists())
+        self.assertEqual(self.timeline(self.u2), [(post.id, True)])
+        self.assertEqual(self.timeline(self.u2), [(post.id, True)])
+
+    def test_entries_are_unique(self):
+        post = Post.objects.create(caption="hello", user=self.u1)
+        share = Share.objects.create(post=post, user=self.u2)
+        # What a concurrent pull would insert a second time
+        for duplicate in ({}, {'actor': self.u2, 'share': share}):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                TimelineEntry.objects.create(owner=self.u1, post=post, **{'actor': self.u1, **duplicate})
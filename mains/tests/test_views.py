@@ -0,0 +1,651 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient, APIRequestFactory
+
+from mains.models import (
+    Profile,
+    Address,
+    Job,
+    Education,
+    PhotoAlbum,
+    Photo,
+    Post,
+    Like,
+    Comment
+)
+from mains.cache import profile_responses
+from mains.serializations import CompactPostSerializer
+
+
+def create_member(username, first_name="Dung", last_name="Nguyen", avatar=None):
+    "Create a user with a profile and, optionally, an active avatar."
+    user = User.objects.create_user(username, password="12345")
+    profile = Profile.objects.create(user=user, first_name=first_name, last_name=last_name)
+    if avatar is not None:
+        album = PhotoAlbum.objects.create(name='avatar', kind=PhotoAlbum.Kind.AVATAR, profile=profile)
+        post = Post.objects.create(caption="avatar", user=user)
+        Photo.objects.create(photo_url="old-" + avatar, album=album, post=post, is_active=False)
+        Photo.objects.create(photo_url=avatar, album=album, post=post, is_active=True)
+    return user
+
+
+class AvatarViewTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1", avatar="u1.png")
+        self.u2 = create_member("1712371", first_name="Minh", avatar="u2.png")
+        self.u3 = create_member("1234", first_name="Lan")
+        for user in (self.u1, self.u2, self.u3):
+            for i in range(3):
+                post = Post.objects.create(caption=f"post {i}", user=user)
+                Comment.objects.create(text="hi", user=user, post=post)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_active_avatars(self):
+        avatars = Photo.objects.active_avatars(
+            [self.u1.profile, self.u2.profile, self.u3.profile])
+        self.assertEqual(avatars, {
+            self.u1.profile.id: "u1.png",
+            self.u2.profile.id: "u2.png",
+        })
+
+    def test_post_list_owner_pic(self):
+        response = self.client.get('/api/v1/posts/')
+        self.assertEqual(response.status_code, 200)
+        pics = {post['owner_name']: post.get('owner_pic') for post in response.data['results']}
+        self.assertEqual(pics, {
+            "Dung Nguyen": "u1.png",
+            "Minh Nguyen": "u2.png",
+            "Lan Nguyen": None,
+        })
+
+    def test_comment_list_owner_pic(self):
+        post = self.u2.posts.filter(caption="post 0").get()
+        response = self.client.get(f'/api/v1/posts/{post.id}/comments/')
+        self.assertEqual(response.status_code, 200)
+        comment = response.data['results'][0]
+        self.assertEqual(comment['owner_pic'], "u2.png")
+        self.assertEqual(comment['profile_id'], self.u2.profile.id)
+
+    def test_user_detail_avatar(self):
+        response = self.client.get('/api/v1/user/')
+        self.assertEqual(response.data['avatar'], "u1.png")
+
+
+class CommentPaginationTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1", avatar="u1.png")
+        self.u2 = create_member("minhdev", first_name="Minh", avatar="u2.png")
+        self.u3 = create_member("landev", first_name="Lan")
+        self.post = Post.objects.create(caption="hello", user=self.u1)
+        self.url = f'/api/v1/posts/{self.post.id}/comments/'
+        client = APIClient()
+        for i in range(6):
+            client.force_authenticate([self.u1, self.u2, self.u3][i % 3])
+            client.post(self.url, {'text': f"comment {i}"})
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def texts(self, url):
+        texts = []
+        while url:
+            # The ETag, the page with its authors and their avatars
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            texts += [comment['text'] for comment in response.data['results']]
+            url = response.data['next']
+        return texts
+
+    def test_oldest_first(self):
+        self.assertEqual(self.texts(f'{self.url}?page_size=4'), [f"comment {i}" for i in range(6)])
+
+    def test_newest_first(self):
+        self.assertEqual(self.texts(f'{self.url}?order=newest&page_size=4'),
+                         [f"comment {i}" for i in reversed(range(6))])
+
+    def test_author_cards(self):
+        response = self.client.get(f'{self.url}?page_size=3')
+        cards = [(comment['owner_name'], comment.get('owner_pic'), comment['profile_id'])
+                 for comment in response.data['results']]
+        self.assertEqual(cards, [
+            ("Dung Nguyen", "u1.png", self.u1.profile.id),
+            ("Minh Nguyen", "u2.png", self.u2.profile.id),
+            ("Lan Nguyen", None, self.u3.profile.id),
+        ])
+        self.assertTrue(response.data['results'][0]['profile'].endswith(f'/api/v1/profiles/{self.u1.profile.id}/'))
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(f'{self.url}?order=random').status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url}?cursor=nope').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/posts/x/comments/').status_code, 404)
+
+
+class PostFeedPaginationTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1")
+        self.u2 = create_member("1712371")
+        for i in range(5):
+            Post.objects.create(caption=f"u1 post {i}", user=self.u1)
+            Post.objects.create(caption=f"u2 post {i}", user=self.u2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def walk(self, url):
+        "Follow the next links, returns the post ids of every page."
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([post['id'] for post in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_pages_are_newest_first(self):
+        pages = self.walk('/api/v1/posts/?page_size=4')
+        self.assertEqual([len(page) for page in pages], [4, 4, 2])
+        expected = list(Post.objects.order_by('-time', '-id').values_list('id', flat=True))
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_profile_filter(self):
+        pages = self.walk(f'/api/v1/posts/?profile={self.u2.profile.id}&page_size=3')
+        ids = sum(pages, [])
+        self.assertEqual(len(ids), 5)
+        self.assertFalse(Post.objects.filter(id__in=ids).exclude(user=self.u2).exists())
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/posts/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+
+class PostCounterTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1")
+        self.post = Post.objects.create(caption="hello", user=self.u1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_counters_follow_reactions(self):
+        url = f'/api/v1/posts/{self.post.id}'
+        like = self.client.post(f'{url}/likes/', {}).data
+        self.client.post(f'{url}/comments/', {'text': "hi"})
+        self.client.post(f'{url}/shares/', {})
+        self.client.delete(f'{url}/likes/{like["id"]}/')
+        self.post.refresh_from_db()
+        self.assertEqual(
+            (self.post.num_likes, self.post.num_comments, self.post.num_shares), (0, 1, 1))
+
+    def test_saving_post_keeps_counters(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        Post.objects.add_to_counter(self.post.id, 'like_count', 1)
+        stale.caption = "edited"
+        stale.save()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.caption, self.post.like_count), ("edited", 1))
+
+    def test_reconcile_command(self):
+        Comment.objects.create(text="hi", user=self.u1, post=self.post)
+        Post.objects.add_to_counter(self.post.id, 'share_count', 3)
+        self.post.refresh_from_db()
+        revision = self.post.revision
+        out = StringIO()
+        call_command('reconcile_post_counters', stdout=out)
+        self.assertIn("1 post(s) reconciled", out.getvalue())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.share_count), (1, 0))
+        self.assertEqual(self.post.revision, revision + 1)
+
+
+class CompactPostTest(TestCase):
+
+    # Setup: a post liked by five members
+    def setUp(self):
+        self.u1 = create_member("dungdev1")
+        self.post = Post.objects.create(caption="viral", user=self.u1)
+        for i in range(5):
+            user = create_member(f"fan{i}")
+            Like.objects.create(post=self.post, user=user)
+            Post.objects.add_to_counter(self.post.id, 'like_count', 1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_previews_are_capped(self):
+        post = self.client.get('/api/v1/posts/').data['results'][0]
+        self.assertEqual(post['num_likes'], 5)
+        self.assertEqual(len(post['likes']), CompactPostSerializer.PREVIEW_SIZE)
+        self.assertEqual(post['comments'], [])
+        self.assertTrue(post['likes_url'].endswith(f'/api/v1/posts/{self.post.id}/likes/'))
+
+    def test_full_representation(self):
+        response = self.client.get('/api/v1/posts/?representation=full')
+        post = response.data['results'][0]
+        self.assertEqual(len(post['likes']), 5)
+        self.assertNotIn('likes_url', post)
+
+    def test_like_list_is_paginated(self):
+        response = self.client.get(f'/api/v1/posts/{self.post.id}/likes/?page_size=3')
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+    def test_viewer_like_id(self):
+        fan = User.objects.get(username="fan0")
+        like = Like.objects.get(user=fan)
+        other = Post.objects.create(caption="other", user=self.u1)
+        self.client.force_authenticate(fan)
+        posts = self.client.get('/api/v1/posts/').data['results']
+        self.assertEqual({post['id']: post['viewer_like_id'] for post in posts},
+                         {self.post.id: like.id, other.id: None})
+        response = self.client.get(f'/api/v1/user/likes/?posts={self.post.id},{other.id}')
+        self.assertEqual(response.data, [{"post_id": self.post.id, "like_id": like.id}])
+
+
+class CreatePostTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1", avatar="u1.png")
+        self.u2 = create_member("1712371")
+        PhotoAlbum.objects.create(name='postPhoto', kind=PhotoAlbum.Kind.POST_PHOTOS, profile=self.u2.profile)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def create(self, urls):
+        return self.client.post(
+            '/api/v1/posts/', {'caption': "trip", 'imageUrl': urls}, format='json')
+
+    def test_photos_go_to_own_album(self):
+        response = self.create(["a.png", "b.png", "c.png"])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['photos']), 3)
+        self.assertEqual(response.data['owner_pic'], "u1.png")
+        album = PhotoAlbum.objects.get(kind=PhotoAlbum.Kind.POST_PHOTOS, profile=self.u1.profile)
+        self.assertEqual(album.photos.count(), 3)
+        self.assertFalse(PhotoAlbum.objects.get(profile=self.u2.profile).photos.exists())
+
+    def test_query_count_is_independent_of_photos(self):
+        self.create(["a.png"])
+        with CaptureQueriesContext(connection) as one:
+            self.create(["a.png"])
+        with CaptureQueriesContext(connection) as many:
+            self.create([f"{i}.png" for i in range(10)])
+        self.assertEqual(len(one), len(many))
+
+
+class ReactorListTest(TestCase):
+
+    # Setup: a post liked by five members, three of them with an avatar
+    def setUp(self):
+        self.u1 = create_member("dungdev1")
+        self.post = Post.objects.create(caption="viral", user=self.u1)
+        for i in range(5):
+            user = create_member(f"fan{i}", first_name=f"Fan{i}", avatar=f"{i}.png" if i % 2 == 0 else None)
+            Like.objects.create(post=self.post, user=user)
+            Post.objects.add_to_counter(self.post.id, 'like_count', 1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_reactor_cards(self):
+        url = f'/api/v1/posts/{self.post.id}/reactors/?content=like&page_size=3'
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(
+            [(card['full_name'], card['avatar']) for card in response.data['results']],
+            [("Fan4 Nguyen", "4.png"), ("Fan3 Nguyen", None), ("Fan2 Nguyen", "2.png")])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_invalid_content(self):
+        response = self.client.get(f'/api/v1/posts/{self.post.id}/reactors/?content=poke')
+        self.assertEqual(response.status_code, 400)
+
+
+class PeopleSearchTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1", first_name="Dung", last_name="Nguyen", avatar="u1.png")
+        create_member("1712371", first_name="Minh", last_name="Dung")
+        create_member("1234", first_name="Dungeon", last_name="Tran")
+        create_member("lan", first_name="Lan", last_name="Pham")
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def search(self, query):
+        response = self.client.get('/api/v1/profiles/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [card['full_name'] for card in response.data['results']]
+
+    def test_prefix_search_is_ranked(self):
+        self.assertEqual(self.search("dung"), ["Dung Nguyen", "Minh Dung", "Dungeon Tran"])
+        self.assertEqual(self.search("DUNG ngu"), ["Dung Nguyen"])
+
+    def test_username_prefix(self):
+        self.assertEqual(self.search("1712"), ["Minh Dung"])
+
+    def test_cards_and_pagination(self):
+        response = self.client.get('/api/v1/profiles/', {'q': "dung", 'limit': 1})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['results'][0]['avatar'], "u1.png")
+        self.assertIsNotNone(response.data['next'])
+
+
+class ProfileCompositeTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1", avatar="u1.png")
+        profile = self.u1.profile
+        for i in range(3):
+            Address.objects.create(city=f"City {i}", profile=profile)
+            Job.objects.create(position="Developer", company=f"Company {i}", city="HCMC",
+                               starting_month=1, starting_year=2015 + i, profile=profile)
+            Education.objects.create(school_name=f"School {i}", concentration="CS",
+                                     starting_year=2010, profile=profile)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_single_request_profile_page(self):
+        url = f'/api/v1/profiles/{self.u1.profile.id}/full/'
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['addresses']), 3)
+        self.assertEqual(len(response.data['jobs']), 3)
+        self.assertEqual(len(response.data['educations']), 3)
+        self.assertEqual(response.data['albums'][0]['num_photos'], 2)
+        self.assertEqual(response.data['avatar'], "u1.png")
+        self.assertTrue(response.data['jobs'][0]['url'].endswith(
+            f"/jobs/{response.data['jobs'][0]['id']}/"))
+
+    def test_unknown_profile(self):
+        response = self.client.get('/api/v1/profiles/0/full/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ResponseCacheTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1", avatar="u1.png")
+        self.profile = self.u1.profile
+        self.job = Job.objects.create(position="Developer", company="Hicomf", city="HCMC",
+                                      starting_month=1, starting_year=2019, profile=self.profile)
+        self.album = self.profile.albums.get()
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_repeated_reads_skip_database(self):
+        urls = [
+            f'/api/v1/profiles/{self.profile.id}/',
+            f'/api/v1/profiles/{self.profile.id}/jobs/{self.job.id}/',
+            f'/api/v1/profiles/{self.profile.id}/albums/{self.album.id}/',
+        ]
+        first = [self.client.get(url).data for url in urls]
+        with self.assertNumQueries(0):
+            second = [self.client.get(url).data for url in urls]
+        self.assertEqual(first, second)
+
+    def test_writes_invalidate(self):
+        job_url = f'/api/v1/profiles/{self.profile.id}/jobs/{self.job.id}/'
+        album_url = f'/api/v1/profiles/{self.profile.id}/albums/{self.album.id}/'
+        self.client.get(job_url)
+        self.client.get(album_url)
+        self.job.company = "Acme"
+        self.job.save()
+        Photo.objects.create(photo_url="new.png", album=self.album,
+                             post=Post.objects.create(caption="new", user=self.u1))
+        self.assertEqual(self.client.get(job_url).data['company'], "Acme")
+        self.assertEqual(self.client.get(album_url).data['num_photos'], 3)
+        self.job.delete()
+        self.assertEqual(self.client.get(job_url).status_code, 404)
+
+    def test_absolute_urls_follow_host(self):
+        url = f'/api/v1/profiles/{self.profile.id}/'
+        self.client.get(url, HTTP_HOST='localhost')
+        response = self.client.get(url, HTTP_HOST='127.0.0.1')
+        self.assertTrue(response.data['url'].startswith('http://127.0.0.1/'))
+
+
+class ResponseCacheCommitTest(TransactionTestCase):
+
+    def test_read_before_commit_is_not_kept(self):
+        profile = create_member("dungdev1").profile
+        request = APIRequestFactory().get('/')
+        profile_responses.version(profile.id)
+        with transaction.atomic():
+            profile.first_name = "Minh"
+            profile.save()
+            # A concurrent request still reads the committed name and caches it
+            profile_responses.get_or_set(request, profile.id, ('profile',), lambda: "Dung")
+        self.assertEqual(profile_responses.get_or_set(request, profile.id, ('profile',), lambda: "Minh"),
+                         "Minh")
+
+
+class ConditionalGetTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1", avatar="u1.png")
+        self.post = Post.objects.create(caption="hello", user=self.u1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+        self.client.post(f'/api/v1/posts/{self.post.id}/comments/', {'text': "hi"})
+        self.photo = self.u1.profile.albums.get().photos.first()
+
+    def revalidate(self, url):
+        "Returns the response to a GET repeated with the ETag of a first GET."
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_resources(self):
+        urls = [
+            f'/api/v1/posts/{self.post.id}/',
+            f'/api/v1/posts/{self.post.id}/comments/',
+            f'/api/v1/photos/{self.photo.id}/',
+            f'/api/v1/profiles/{self.u1.profile.id}/',
+        ]
+        for url in urls:
+            etag = self.client.get(url)['ETag']
+            self.assertFalse(etag.startswith('W/'))
+            with self.assertNumQueries(1 if 'profiles' not in url else 0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_changes_move_etag(self):
+        post_url = f'/api/v1/posts/{self.post.id}/'
+        comments_url = f'/api/v1/posts/{self.post.id}/comments/'
+        post_etag = self.client.get(post_url)['ETag']
+        comments_etag = self.client.get(comments_url)['ETag']
+        self.client.post(comments_url, {'text': "second"})
+        response = self.client.get(post_url, HTTP_IF_NONE_MATCH=post_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['num_comments'], 2)
+        response = self.client.get(comments_url, HTTP_IF_NONE_MATCH=comments_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_cache_control(self):
+        response = self.client.get(f'/api/v1/posts/{self.post.id}/')
+        self.assertIn('no-cache', response['Cache-Control'])
+        response = self.client.get(f'/api/v1/photos/{self.photo.id}/')
+        self.assertIn('max-age=300', response['Cache-Control'])
+
+    def test_missing_resource(self):
+        response = self.client.get('/api/v1/posts/0/', HTTP_IF_NONE_MATCH='"post-0"')
+        self.assertEqual(response.status_code, 404)
+
+    def test_commenter_avatar_moves_comment_list_etag(self):
+        url = f'/api/v1/posts/{self.post.id}/comments/'
+        etag = self.client.get(url)['ETag']
+        Photo.objects.set_avatar(self.u1.profile, "new-u1.png")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['owner_pic'], "new-u1.png")
+
+    def test_missing_profile_has_no_etag(self):
+        for _ in range(2):
+            response = self.client.get('/api/v1/profiles/0/')
+            self.assertEqual(response.status_code, 404)
+            self.assertFalse(response.has_header('ETag'))
+        url = f'/api/v1/profiles/{self.u1.profile.id}/'
+        etag = self.client.get(url)['ETag']
+        self.u1.profile.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+
+class AlbumTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1", avatar="u1.png")
+        self.profile = self.u1.profile
+        self.album = PhotoAlbum.objects.create(name="holiday", profile=self.profile)
+        post = Post.objects.create(caption="holiday", user=self.u1)
+        Photo.objects.bulk_create([
+            Photo(photo_url=f"holiday-{i}.png", album=self.album, post=post, owner=self.profile)
+            for i in range(7)
+        ])
+        PhotoAlbum.objects.create(name="empty", profile=self.profile)
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_album_list_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/v1/profiles/{self.profile.id}/albums/')
+        albums = {album['name']: (album['num_photos'], album['cover']) for album in response.data}
+        self.assertEqual(albums, {
+            'avatar': (2, "u1.png"),
+            'holiday': (7, "holiday-6.png"),
+            'empty': (0, None),
+        })
+        self.assertNotIn('photos', response.data[0])
+
+    def test_photo_grid(self):
+        url = self.client.get(
+            f'/api/v1/profiles/{self.profile.id}/albums/{self.album.id}/').data['photos_url']
+        urls = []
+        url += '?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            urls += [photo['photo_url'] for photo in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(urls, [f"holiday-{i}.png" for i in reversed(range(7))])
+
+    def test_photo_grid_of_another_profile(self):
+        other = create_member("1712371")
+        response = self.client.get(f'/api/v1/profiles/{other.profile.id}/albums/{self.album.id}/photos/')
+        self.assertEqual(response.status_code, 404)
+
+
+class AvatarSwapTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1", avatar="u1.png")
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+
+    def test_swap_keeps_one_active_avatar(self):
+        response = self.client.put(f'/api/v1/profiles/{self.u1.profile.id}/', {
+            'first_name': "Dung", 'last_name': "Nguyen", 'user_avatar': "new.png"}, format='json')
+        self.assertEqual(response.data['avatar'], "new.png")
+        album = PhotoAlbum.objects.get(profile=self.u1.profile, kind=PhotoAlbum.Kind.AVATAR)
+        self.assertEqual(list(album.photos.filter(is_active=True).values_list('photo_url', flat=True)),
+                         ["new.png"])
+        self.assertEqual(self.client.get('/api/v1/user/').data['avatar'], "new.png")
+
+    def test_first_avatar_creates_album(self):
+        user = create_member("1712371")
+        Photo.objects.set_avatar(user.profile, "first.png")
+        self.assertEqual(Photo.objects.active_avatars([user.profile]), {user.profile.id: "first.png"})
+
+    def test_second_active_photo_is_rejected(self):
+        album = PhotoAlbum.objects.get(profile=self.u1.profile, kind=PhotoAlbum.Kind.AVATAR)
+        with self.assertRaises(IntegrityError):
+            Photo.objects.create(photo_url="x.png", album=album, post=album.photos.first().post,
+                                 is_active=True)
+
+    def test_album_named_avatar_is_not_an_avatar(self):
+        user = create_member("1712371")
+        album = PhotoAlbum.objects.create(name='avatar', profile=user.profile)
+        Photo.objects.create(photo_url="x.png", album=album, is_active=True,
+                             post=Post.objects.create(caption="x", user=user))
+        self.assertEqual(Photo.objects.active_avatars([user.profile]), {})
+
+    def test_second_avatar_album_is_rejected(self):
+        profile = self.u1.profile
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PhotoAlbum.objects.create(name='avatar', kind=PhotoAlbum.Kind.AVATAR, profile=profile)
+        # Custom albums are free to share a name
+        for _ in range(2):
+            PhotoAlbum.objects.create(name='avatar', profile=profile)
+        self.assertEqual(profile.albums.filter(kind=PhotoAlbum.Kind.CUSTOM).count(), 2)
+
+
+class PhotoStreamTest(TestCase):
+
+    # Setup
+    def setUp(self):
+        self.u1 = create_member("dungdev1", avatar="u1.png")
+        self.profile = self.u1.profile
+        self.client = APIClient()
+        self.client.force_authenticate(self.u1)
+        for i in range(3):
+            self.client.post('/api/v1/posts/', {'caption': f"post {i}", 'imageUrl': [f"p{i}-a.png", f"p{i}-b.png"]},
+                             format='json')
+
+    def stream(self, url):
+        urls = []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            urls += [photo['photo_url'] for photo in response.data['results']]
+            url = response.data['next']
+        return urls
+
+    def test_profile_stream(self):
+        urls = self.stream(f'/api/v1/photos/?profile_id={self.profile.id}&page_size=3&mode=grid')
+        self.assertEqual(urls, ["p2-b.png", "p2-a.png", "p1-b.png", "p1-a.png", "p0-b.png", "p0-a.png",
+                                "u1.png", "old-u1.png"])
+
+    def test_album_filter(self):
+        album = PhotoAlbum.objects.get(profile=self.profile, kind=PhotoAlbum.Kind.POST_PHOTOS)
+        response = self.client.get(f'/api/v1/photos/?profile_id={self.profile.id}&album={album.id}&page_size=2')
+        self.assertEqual([photo['photo_url'] for photo in response.data['results']], ["p2-b.png", "p2-a.png"])
+        self.assertIn('post', response.data['results'][0])
+        avatar = PhotoAlbum.objects.get(profile=self.profile, kind=PhotoAlbum.Kind.AVATAR)
+        response = self.client.get(f'/api/v1/photos/?profile_id={self.profile.id}&album={avatar.id}')
+        self.assertEqual(response.data['photo_url'], "u1.png")
+
+    def test_photo_belongs_to_post_author(self):
+        u2 = create_member("minhdev", first_name="Minh")
+        album = PhotoAlbum.objects.get(profile=self.profile, kind=PhotoAlbum.Kind.POST_PHOTOS)
+        # Post photos used to be filed in one shared album
+        photo = Photo.objects.create(photo_url="u2-post.png", album=album,
+                                     post=Post.objects.create(caption="mine", user=u2))
+        self.assertEqual(photo.owner_id, u2.profile.id)
+        response = self.client.get(f'/api/v1/photos/?profile_id={u2.profile.id}')
+        self.assertEqual([photo['photo_url'] for photo in response.data['results']], ["u2-post.png"])
+
+    def test_profile_id_is_required(self):
+        self.assertEqual(self.client.get('/api/v1/photos/').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/photos/?profile_id=x').status_code, 404)
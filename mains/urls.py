@@ -8,6 +8,8 @@ urlpatterns = [
     path('api/v1/profiles/', views.profile_list, name='profile-list'),
     path('api/v1/profiles/<str:pk>/',
          views.ProfileDetail.as_view(), name='profile-detail'),
+    path('api/v1/profiles/<str:pk>/full/',
+         views.ProfileComposite.as_view(), name='profile-composite'),
     path('api/v1/profiles/<str:profile_pk>/addresses/',
          views.address_list, name='address-list'),
     path('api/v1/profiles/<str:profile_pk>/addresses/<str:address_pk>/',
@@ -22,6 +24,8 @@ urlpatterns = [
          views.EducationDetail.as_view(), name='education-detail'),
     path('api/v1/profiles/<str:profile_pk>/albums/',
          views.AlbumList.as_view(), name='album-list'),
+    path('api/v1/profiles/<str:profile_pk>/albums/<str:album_pk>/photos/',
+         views.AlbumPhotoList.as_view(), name='album-photo-list'),
     path('api/v1/profiles/<str:profile_pk>/albums/<str:album_pk>/', views.AlbumDetail.as_view(),
          name='album-detail'),
     path('api/v1/photos/', views.PhotoList.as_view(), name='photo-list'),
@@ -29,6 +33,9 @@ urlpatterns = [
          views.PhotoDetail.as_view(), name='photo-detail'),
     path('api/v1/posts/', views.PostList.as_view(), name='post-list'),
     path('api/v1/posts/<str:pk>/', views.PostDetail.as_view(), name='post-detail'),
+    path('api/v1/posts/<str:post_pk>/reactors/',
+         views.ReactorList.as_view(), name='reactor-list'),
+    path('api/v1/timeline/', views.TimelineList.as_view(), name='timeline'),
     path('api/v1/posts/<str:post_pk>/likes/',
          views.LikeList.as_view(), name='like-list'),
     path('api/v1/posts/<str:post_pk>/likes/<str:like_pk>/',
@@ -42,6 +49,25 @@ urlpatterns = [
     path('api/v1/posts/<str:post_pk>/shares/<str:share_pk>/',
          views.ShareDetail.as_view(), name='share-detail'),
     path('api/v1/user/', views.UserDetail.as_view(), name='user-detail'),
+    path('api/v1/user/likes/', views.UserLikeList.as_view(), name='user-like-list'),
+    path('api/v1/user/friends/<str:username>/', views.FriendDetail.as_view(),
+         name='friend-detail'),
+    path('api/v1/profiles/<str:profile_pk>/friends/', views.FriendList.as_view(),
+         name='friend-list'),
+    path('api/v1/friend-requests/', views.FriendshipRequestList.as_view(),
+         name='friendship-request-list'),
+    path('api/v1/friend-requests/count/', views.FriendshipRequestCount.as_view(),
+         name='friendship-request-count'),
+    path('api/v1/friend-requests/bulk/', views.FriendshipRequestAnswer.as_view(),
+         name='friendship-request-bulk'),
+    path('api/v1/friend-requests/<int:pk>/', views.FriendshipRequestDetail.as_view(),
+         name='friendship-request-detail'),
+    path('api/v1/friend-requests/<int:pk>/accept/', views.FriendshipRequestAnswer.as_view(),
+         {'action': 'accept'}, name='friendship-request-accept'),
+    path('api/v1/friend-requests/<int:pk>/decline/', views.FriendshipRequestAnswer.as_view(),
+         {'action': 'decline'}, name='friendship-request-decline'),
+    path('api/v1/user/suggestions/', views.FriendSuggestionList.as_view(),
+         name='friend-suggestion-list'),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
@@ -1,10 +1,11 @@
 from functools import wraps
-import jwt
 
 from django.shortcuts import render
 from django.http import JsonResponse, Http404
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch, Q
 from rest_framework.status import HTTP_202_ACCEPTED
 from rest_framework.utils import serializer_helpers
 
@@ -16,35 +17,36 @@ from rest_framework.reverse import reverse
 from rest_framework.permissions import AllowAny
 
 from mains.serializations import (
-    CommentSerializer, ProfileSerializer,
+    CommentSerializer, ProfileSerializer, ProfileCardSerializer,
+    ProfileCompositeSerializer,
     AddressSerializer,
     JobSerializer,
     EducationSerializer,
     AlbumSerializer,
     PhotoSerializer,
-    PostSerializer,
-    LikeSerializer, ShareSerializer
+    PostSerializer, CompactPostSerializer,
+    LikeSerializer, ShareSerializer, FriendshipRequestSerializer
 )
+from auth0authorization.claims import get_token_claims
 from mains.models import (
     Profile, Address, Job, Education,
-    PhotoAlbum, Photo, Post, Like, Comment, Share
+    PhotoAlbum, Photo, Post, Like, Comment, Share, TimelineEntry,
+    Friendship, FriendshipRequest
 )
+from mains.signals import friendship_request_created
+from mains.cache import profile_responses
+from mains.conditional import (
+    conditional, profile_etag, post_etag, comment_list_etag, comment_etag, photo_etag
+)
+from mains.graph import get_friend_graph
+from mains.pagination import KeysetPagination, SearchPagination
 from mains.permissions import IsOwnerOrReadOnly, AllowPostOwnerDelete
+from mains.search import search_profiles
 
 
 # Validate scope
 
 
-def get_token_auth_header(request):
-    """Obtains the Access Token from the Authorization Header
-    """
-    auth = request.META.get("HTTP_AUTHORIZATION", None)
-    parts = auth.split()
-    token = parts[1]
-
-    return token
-
-
 def requires_scope(required_scope):
     """Determines if the required scope is present in the Access Token
     Args:
@@ -53,13 +55,9 @@ def requires_scope(required_scope):
     def require_scope(f):
         @wraps(f)
         def decorated(*args, **kwargs):
-            token = get_token_auth_header(args[0])
-            decoded = jwt.decode(token, verify=False)
-            if decoded.get("scope"):
-                token_scopes = decoded["scope"].split()
-                for token_scope in token_scopes:
-                    if token_scope == required_scope:
-                        return f(*args, **kwargs)
+            claims = get_token_claims(args[0])
+            if claims is not None and claims.has_scope(required_scope):
+                return f(*args, **kwargs)
             response = JsonResponse(
                 {'message': 'You don\'t have access to this resource'})
             response.status_code = 403
@@ -68,6 +66,30 @@ def requires_scope(required_scope):
     return require_scope
 
 
+def owner_data(request, profile, avatars):
+    """Returns the profile link, name and active avatar of a post or comment owner,
+    `avatars` is the {profile id: url} map built by `Photo.objects.active_avatars`.
+    """
+    data = {
+        'profile': request.build_absolute_uri(
+            reverse('profile-detail', args=(profile.id,))),
+        'owner_name': profile.full_name,
+    }
+    if profile.id in avatars:
+        data['owner_pic'] = avatars[profile.id]
+    return data
+
+
+def post_list_serializer(request, posts):
+    """Returns the serializer of a page of posts: the compact representation,
+    or the full one (every like, comment and share link) with `?representation=full`.
+    """
+    if request.query_params.get('representation') == 'full':
+        return PostSerializer(posts, many=True, context={'request': request})
+    Post.objects.attach_previews(posts, CompactPostSerializer.PREVIEW_SIZE)
+    return CompactPostSerializer(posts, many=True, context={'request': request})
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def api_root(request, format=None):
@@ -77,31 +99,39 @@ def api_root(request, format=None):
     })
 
 
+# Reactions by `content` query parameter: (model, related name of User)
+REACTIONS = {
+    'like': (Like, 'likes'),
+    'comment': (Comment, 'comments'),
+    'share': (Share, 'shares'),
+}
+
+
 @api_view(['GET', 'POST'])
 def profile_list(request):
     """
-    List all users, or create a new profile.
+    List all users, search them with `?q=`, or create a new profile.
     """
     if request.method == 'GET':
-        queryset = []
+        search = request.query_params.get('q', None)
+        if search is not None:
+            # People search, ranked profile cards
+            paginator = SearchPagination()
+            profiles = paginator.paginate_queryset(
+                search_profiles(search), request)
+            serializer = ProfileCardSerializer(profiles, many=True, context={
+                'request': request,
+                'avatars': Photo.objects.active_avatars(profiles),
+            })
+            return paginator.get_paginated_response(serializer.data)
+
         post_id = request.query_params.get('postId', None)
         content = request.query_params.get('content', None)
-        if post_id and content:
-            if content == 'like':
-                likes = Post.objects.get(pk=post_id).likes.all()
-                for like in likes:
-                    profile = like.user.profile
-                    queryset.append(profile)
-            elif content == 'comment':
-                comments = Post.objects.get(pk=post_id).comments.all()
-                for comment in comments:
-                    profile = comment.user.profile
-                    queryset.append(profile)
-            elif content == 'share':
-                shares = Post.objects.get(pk=post_id).shares.all()
-                for share in shares:
-                    profile = share.user.profile
-                    queryset.append(profile)
+        if post_id and content in REACTIONS:
+            reactions = REACTIONS[content][1]
+            queryset = Profile.objects.filter(**{f'user__{reactions}__post': post_id})
+        elif post_id and content:
+            queryset = []
         else:
             queryset = Profile.objects.all()
 
@@ -120,17 +150,41 @@ def profile_list(request):
                 return Response(status=HTTP_202_ACCEPTED)
             # Has Profile, create Album, Post and Photo
             profile = Profile.objects.get(user=request.user)
-            album = PhotoAlbum.objects.create(name='avatar', profile=profile)
-            post = Post.objects.create(
-                caption=f"{profile.full_name} has updated his avatar",
-                user=profile.user
-            )
-            Photo.objects.create(
-                photo_url=user_avatar, album=album, post=post, is_active=True)
+            Photo.objects.set_avatar(profile, user_avatar)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ReactorList(APIView):
+    """
+    Profile cards of the users who liked, commented or shared a post
+    (`?content=like|comment|share`), newest reaction first.
+    """
+
+    def get(self, request, post_pk):
+        content = request.query_params.get('content', 'like')
+        if content not in REACTIONS:
+            return Response({"detail": "content must be one of like, comment or share."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            post = Post.objects.only(*Post.COUNTERS).get(pk=post_pk)
+        except (ValueError, Post.DoesNotExist):
+            raise Http404
+        model = REACTIONS[content][0]
+        queryset = model.objects.filter(post=post).select_related('user__profile').only(
+            'id', 'user__id', 'user__profile__id', 'user__profile__first_name',
+            'user__profile__last_name')
+        paginator = KeysetPagination(ordering=('-id',))
+        reactions = paginator.paginate_queryset(queryset, request)
+        profiles = [reaction.user.profile for reaction in reactions]
+        serializer = ProfileCardSerializer(profiles, many=True, context={
+            'request': request,
+            'avatars': Photo.objects.active_avatars(profiles),
+        })
+        return paginator.get_paginated_response(
+            serializer.data, count=getattr(post, f'{content}_count'))
+
+
 class ProfileDetail(APIView):
     permission_classes = [IsOwnerOrReadOnly]
 
@@ -144,10 +198,12 @@ class ProfileDetail(APIView):
         self.check_object_permissions(self.request, profile)
         return profile
 
+    @conditional(profile_etag, private=True, no_cache=True)
     def get(self, request, pk, format=None):
-        profile = self.get_object(pk)
-        serializer = ProfileSerializer(profile, context={'request': request})
-        return Response(serializer.data)
+        def build():
+            profile = self.get_object(pk)
+            return ProfileSerializer(profile, context={'request': request}).data
+        return Response(profile_responses.get_or_set(request, pk, ('profile',), build))
 
     def put(self, request, pk, format=None):
         user_avatar = request.data.pop('user_avatar', None)
@@ -157,16 +213,7 @@ class ProfileDetail(APIView):
         if serializer.is_valid():
             serializer.save()
             if user_avatar is not None:
-                album = PhotoAlbum.objects.get(name='avatar', profile=profile)
-                post = Post.objects.create(
-                    caption=f"{profile.full_name} has updated his avatar",
-                    user=profile.user
-                )
-                current_avatar = Photo.objects.get(album=album, is_active=True)
-                current_avatar.is_active = False
-                current_avatar.save()
-                photo = Photo.objects.create(
-                    photo_url=user_avatar, album=album, post=post, is_active=True)
+                photo = Photo.objects.set_avatar(profile, user_avatar)
                 return Response({**serializer.data, 'avatar': photo.photo_url})
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -177,6 +224,25 @@ class ProfileDetail(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class ProfileComposite(APIView):
+    """
+    Profile page in one request: the profile, its avatar and its addresses,
+    jobs, educations and albums.
+    """
+
+    def get(self, request, pk):
+        try:
+            profile = Profile.objects.prefetch_related(
+                'addresses', 'jobs', 'educations',
+                Prefetch('albums', queryset=PhotoAlbum.objects.with_stats()),
+            ).get(pk=pk)
+        except (ValueError, Profile.DoesNotExist):
+            raise Http404
+        serializer = ProfileCompositeSerializer(profile, context={'request': request})
+        avatar = Photo.objects.active_avatars([profile.id]).get(profile.id)
+        return Response({**serializer.data, 'avatar': avatar})
+
+
 @api_view(['GET', 'POST'])
 def address_list(request, profile_pk):
     # Check user is ouwner of address list
@@ -224,12 +290,16 @@ class AddressDetail(APIView):
         self.check_object_permissions(self.request, address.profile)
         return address
 
-    def get(self, request, *args, **kwargs):
-        address = self.get_object(**kwargs)
-        serializer = AddressSerializer(address, context={'request': request})
-        url = request.build_absolute_uri(
-            reverse('address-detail', args=(address.profile.id, address.id)))
-        return Response({"url": url, **serializer.data})
+    @conditional(profile_etag, private=True, no_cache=True)
+    def get(self, request, profile_pk, address_pk):
+        def build():
+            address = self.get_object(profile_pk, address_pk)
+            serializer = AddressSerializer(address, context={'request': request})
+            url = request.build_absolute_uri(
+                reverse('address-detail', args=(address.profile_id, address.id)))
+            return {"url": url, **serializer.data}
+        return Response(profile_responses.get_or_set(
+            request, profile_pk, ('address', address_pk), build))
 
     def put(self, request, *args, **kwargs):
         address = self.get_object(**kwargs)
@@ -291,12 +361,16 @@ class JobDetail(APIView):
         self.check_object_permissions(self.request, job.profile)
         return job
 
+    @conditional(profile_etag, private=True, no_cache=True)
     def get(self, request, profile_pk, job_pk):
-        job = self.get_object(profile_pk, job_pk)
-        serializer = JobSerializer(job, context={'request': request})
-        url = request.build_absolute_uri(
-            reverse('job-detail', args=(job.profile.id, job.id)))
-        return Response({'url': url, **serializer.data})
+        def build():
+            job = self.get_object(profile_pk, job_pk)
+            serializer = JobSerializer(job, context={'request': request})
+            url = request.build_absolute_uri(
+                reverse('job-detail', args=(job.profile_id, job.id)))
+            return {'url': url, **serializer.data}
+        return Response(profile_responses.get_or_set(
+            request, profile_pk, ('job', job_pk), build))
 
     def put(self, request, profile_pk, job_pk):
         job = self.get_object(profile_pk, job_pk)
@@ -357,12 +431,16 @@ class EducationDetail(APIView):
         self.check_object_permissions(self.request, edu.profile)
         return edu
 
-    def get(self, request, *args, **kwargs):
-        edu = self.get_object(**kwargs)
-        serializer = EducationSerializer(edu, context={'request': request})
-        url = request.build_absolute_uri(
-            reverse('education-detail', args=(edu.profile.id, edu.id)))
-        return Response({'url': url, **serializer.data})
+    @conditional(profile_etag, private=True, no_cache=True)
+    def get(self, request, profile_pk, edu_pk):
+        def build():
+            edu = self.get_object(profile_pk, edu_pk)
+            serializer = EducationSerializer(edu, context={'request': request})
+            url = request.build_absolute_uri(
+                reverse('education-detail', args=(edu.profile_id, edu.id)))
+            return {'url': url, **serializer.data}
+        return Response(profile_responses.get_or_set(
+            request, profile_pk, ('education', edu_pk), build))
 
     def put(self, request, *args, **kwargs):
         edu = self.get_object(**kwargs)
@@ -383,7 +461,7 @@ class AlbumList(APIView):
 
     def get(self, request, profile_pk):
         try:
-            albums = PhotoAlbum.objects.filter(profile=profile_pk)
+            albums = PhotoAlbum.objects.with_stats().filter(profile=profile_pk)
             serializer = AlbumSerializer(
                 albums, many=True, context={'request': request})
             return Response(serializer.data)
@@ -412,7 +490,7 @@ class AlbumDetail(APIView):
 
     def get_object(self, profile_pk, album_pk):
         try:
-            album = PhotoAlbum.objects.filter(
+            album = PhotoAlbum.objects.with_stats().filter(
                 profile=profile_pk).get(id=album_pk)
         except ValidationError:
             raise Http404
@@ -421,12 +499,16 @@ class AlbumDetail(APIView):
         self.check_object_permissions(self.request, album.profile)
         return album
 
-    def get(self, request, *args, **kwargs):
-        album = self.get_object(**kwargs)
-        serializer = AlbumSerializer(album, context={'request': request})
-        url = request.build_absolute_uri(
-            reverse('album-detail', args=(album.profile.id, album.id)))
-        return Response({'url': url, **serializer.data})
+    @conditional(profile_etag, private=True, no_cache=True)
+    def get(self, request, profile_pk, album_pk):
+        def build():
+            album = self.get_object(profile_pk, album_pk)
+            serializer = AlbumSerializer(album, context={'request': request})
+            url = request.build_absolute_uri(
+                reverse('album-detail', args=(album.profile_id, album.id)))
+            return {'url': url, **serializer.data}
+        return Response(profile_responses.get_or_set(
+            request, profile_pk, ('album', album_pk), build))
 
     def put(self, request, *args, **kwargs):
         album = self.get_object(**kwargs)
@@ -443,59 +525,106 @@ class AlbumDetail(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class AlbumPhotoList(APIView):
+    """
+    Photo grid of an album, newest first, keyset-paginated.
+    """
+
+    def get(self, request, profile_pk, album_pk):
+        try:
+            album = PhotoAlbum.objects.only('id').get(profile=profile_pk, pk=album_pk)
+        except (ValueError, PhotoAlbum.DoesNotExist):
+            raise Http404
+        paginator = KeysetPagination(ordering=('-id',))
+        photos = paginator.paginate_queryset(Photo.objects.filter(album=album), request)
+        serializer = PhotoSerializer(photos, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+
 class PostList(APIView):
 
     def get(self, request):
-        queryset = Post.objects.all()
+        queryset = Post.objects.select_related(
+            'user__profile').prefetch_related('photos')
         profile_id = request.query_params.get('profile', None)
         if profile_id is not None:
-            user = Profile.objects.get(pk=profile_id).user
-            queryset = queryset.filter(user=user)
-        serializer = PostSerializer(
-            queryset, many=True, context={'request': request})
-        for i, post in enumerate(queryset):
-            profile = request.build_absolute_uri(
-                reverse('profile-detail', args=(post.user.profile.id,)))
-            serializer.data[i]['profile'] = profile
-            serializer.data[i]['owner_name'] = post.user.profile.full_name
-            for album in post.user.profile.albums.all():
-                if album.name == 'avatar':
-                    for photo in album.photos.all():
-                        if photo.is_active:
-                            serializer.data[i]['owner_pic'] = photo.photo_url
-        return Response(serializer.data)
+            try:
+                user_id = User.objects.values_list(
+                    'id', flat=True).get(profile=profile_id)
+            except (ValueError, User.DoesNotExist):
+                raise Http404
+            queryset = queryset.filter(user=user_id)
+        paginator = KeysetPagination(ordering=('-time', '-id'))
+        posts = paginator.paginate_queryset(queryset, request)
+        serializer = post_list_serializer(request, posts)
+        data = serializer.data
+        avatars = Photo.objects.active_avatars(
+            {post.user.profile.id for post in posts})
+        liked = Like.objects.liked_ids(request.user, [post.id for post in posts])
+        for i, post in enumerate(posts):
+            data[i].update(owner_data(request, post.user.profile, avatars))
+            data[i]['viewer_like_id'] = liked.get(post.id)
+        return paginator.get_paginated_response(data)
 
     def post(self, request):
         photos_url = request.data.pop('imageUrl', None)
         serializer = PostSerializer(
             data=request.data, context={'request': request})
         if serializer.is_valid():
-            serializer.save(user=request.user)
-            data = {**serializer.data}
-            post = Post.objects.latest('time')
-            if photos_url is not None:
-                for photo_url in photos_url:
-                    try:
-                        photo_album = PhotoAlbum.objects.get(name='postPhoto')
-                    except PhotoAlbum.DoesNotExist:
-                        photo_album = PhotoAlbum.objects.create(
-                            name="postPhoto", profile=request.user.profile)                                
-                    Photo.objects.create(photo_url=photo_url, album=photo_album, post=post)
+            profile = request.user.profile
+            with transaction.atomic():
+                post = serializer.save(user=request.user)
+                if photos_url:
+                    photo_album, _ = PhotoAlbum.objects.get_or_create(
+                        kind=PhotoAlbum.Kind.POST_PHOTOS, profile=profile,
+                        defaults={'name': 'postPhoto'})
+                    Photo.objects.bulk_create([
+                        Photo(photo_url=photo_url, album=photo_album, post=post, owner=profile)
+                        for photo_url in photos_url
+                    ])
+                    # bulk_create sends no post_save
+                    profile_responses.bump(profile.id)
             serializer = PostSerializer(post, context={'request': request})
             data = {**serializer.data}
-            profile = request.build_absolute_uri(
-                reverse('profile-detail', args=(post.user.profile.id,)))
-            data['profile'] = profile
-            data['owner_name'] = post.user.profile.full_name
-            for album in post.user.profile.albums.all():
-                if album.name == 'avatar':
-                    for photo in album.photos.all():
-                        if photo.is_active:
-                            data['owner_pic'] = photo.photo_url
+            data.update(owner_data(
+                request, profile, Photo.objects.active_avatars([profile.id])))
             return Response(data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TimelineList(APIView):
+    """
+    Home timeline of the request user: their own and their friends' posts and shares,
+    newest first, read from the materialized timeline entries.
+    """
+
+    def get(self, request):
+        if not request.query_params.get(KeysetPagination.cursor_query_param):
+            TimelineEntry.objects.pull(request.user)
+        queryset = TimelineEntry.objects.filter(owner=request.user).select_related(
+            'post__user__profile', 'actor__profile').prefetch_related('post__photos')
+        paginator = KeysetPagination(ordering=('-time', '-id'))
+        entries = paginator.paginate_queryset(queryset, request)
+        serializer = post_list_serializer(
+            request, [entry.post for entry in entries])
+        data = serializer.data
+        avatars = Photo.objects.active_avatars(
+            {entry.post.user.profile.id for entry in entries})
+        liked = Like.objects.liked_ids(
+            request.user, [entry.post_id for entry in entries])
+        for i, entry in enumerate(entries):
+            data[i].update(owner_data(request, entry.post.user.profile, avatars))
+            data[i]['viewer_like_id'] = liked.get(entry.post_id)
+            data[i]['shared_by'] = None
+            if entry.share_id is not None:
+                data[i]['shared_by'] = {
+                    'profile': request.build_absolute_uri(
+                        reverse('profile-detail', args=(entry.actor.profile.id,))),
+                    'name': entry.actor.profile.full_name,
+                }
+        return paginator.get_paginated_response(data)
+
+
 class PostDetail(APIView):
     permission_classes = [IsOwnerOrReadOnly]
 
@@ -509,6 +638,7 @@ class PostDetail(APIView):
         self.check_object_permissions(self.request, post)
         return post
 
+    @conditional(post_etag, private=True, no_cache=True)
     def get(self, request, pk):
         post = self.get_object(pk)
         serializer = PostSerializer(post, context={'request': request})
@@ -532,27 +662,38 @@ class PostDetail(APIView):
 
 
 class PhotoList(APIView):
+    """
+    Photo stream of a profile (`?profile_id=`, required), newest first and
+    keyset-paginated, optionally restricted to one `?album=`. The avatar album
+    gives the active avatar only. `?mode=grid` only returns ids and urls.
+    """
 
     def get(self, request):
-        queryset = Photo.objects.all()
         profile_param = request.query_params.get('profile_id', None)
         album_param = request.query_params.get('album', None)
-        if profile_param is not None:
-            queryset = queryset.filter(post__user__profile=profile_param)
+        if profile_param is None:
+            return Response({"detail": "profile_id is required."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            queryset = Photo.objects.filter(owner=int(profile_param))
             if album_param is not None:
-                try:
-                    album = PhotoAlbum.objects.get(pk=album_param)
-                    queryset = queryset.filter(album=album)
-                    if album.name == 'avatar':
-                        serializer = PhotoSerializer(queryset.get(
-                            is_active=True), context={'request': request})
-                        return Response(serializer.data)
-                except PhotoAlbum.DoesNotExist:
-                    raise Http404
+                album = PhotoAlbum.objects.only('id', 'kind').get(pk=int(album_param), profile=int(profile_param))
+                queryset = queryset.filter(album=album)
+                if album.kind == PhotoAlbum.Kind.AVATAR:
+                    serializer = PhotoSerializer(queryset.get(
+                        is_active=True), context={'request': request})
+                    return Response(serializer.data)
+        except (ValueError, PhotoAlbum.DoesNotExist, Photo.DoesNotExist):
+            raise Http404
 
-            serializer = PhotoSerializer(
-                queryset, many=True, context={'request': request})
-            return Response(serializer.data)
+        paginator = KeysetPagination(ordering=('-id',))
+        if request.query_params.get('mode') == 'grid':
+            photos = paginator.paginate_queryset(queryset.only('id', 'photo_url'), request)
+            data = [{'id': photo.id, 'photo_url': photo.photo_url} for photo in photos]
+        else:
+            photos = paginator.paginate_queryset(queryset, request)
+            data = PhotoSerializer(photos, many=True, context={'request': request}).data
+        return paginator.get_paginated_response(data)
 
     def post(self, request):
         try:
@@ -587,6 +728,8 @@ class PhotoDetail(APIView):
         self.check_object_permissions(self.request, photo.post)
         return photo
 
+    # Photo urls rarely change, let clients reuse them for a while
+    @conditional(photo_etag, private=True, max_age=300)
     def get(self, request, pk):
         photo = self.get_object(pk)
         album = request.build_absolute_uri(
@@ -613,10 +756,12 @@ class LikeList(APIView):
 
     def get(self, request, post_pk):
         try:
-            likes = Like.objects.filter(post=post_pk)
+            paginator = KeysetPagination(ordering=('id',))
+            likes = paginator.paginate_queryset(
+                Like.objects.filter(post=post_pk), request)
             serializer = LikeSerializer(
                 likes, many=True, context={'request': request})
-            return Response(serializer.data)
+            return paginator.get_paginated_response(serializer.data)
         except ValidationError:
             raise Http404
 
@@ -627,7 +772,9 @@ class LikeList(APIView):
             if serializer.is_valid():
                 try:
                     post = Post.objects.get(pk=post_pk)
-                    serializer.save(post=post, user=request.user)
+                    with transaction.atomic():
+                        serializer.save(post=post, user=request.user)
+                        Post.objects.add_to_counter(post.id, 'like_count', 1)
                     return Response(serializer.data, status=status.HTTP_201_CREATED)
                 except Post.DoesNotExist:
                     raise Http404
@@ -661,33 +808,37 @@ class LikeDetail(APIView):
 
     def delete(self, request, *args, **kwargs):
         like = self.get_object(**kwargs)
-        like.delete()
+        with transaction.atomic():
+            like.delete()
+            Post.objects.add_to_counter(like.post_id, 'like_count', -1)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class CommentList(APIView):
 
+    @conditional(comment_list_etag, private=True, no_cache=True)
     def get(self, request, post_pk):
+        order = request.query_params.get('order', 'oldest')
+        if order not in Comment.ORDERINGS:
+            return Response({"detail": "order must be oldest or newest."},
+                            status=status.HTTP_400_BAD_REQUEST)
         try:
-            comments = Comment.objects.filter(post=post_pk)
-            serializer = CommentSerializer(
-                comments, many=True, context={'request': request})
-            for i, comment in enumerate(comments):                
-                profile = request.build_absolute_uri(
-                    reverse('profile-detail', args=(comment.user.profile.id,))
-                )
-                serializer.data[i]['profile_id'] = comment.user.profile.id
-                serializer.data[i]['profile'] = profile
-                serializer.data[i]['owner_name'] = comment.user.profile.full_name
-                serializer.data[i]['post_id'] = comment.post.id
-                for album in comment.user.profile.albums.all():
-                    if album.name == 'avatar':
-                        for photo in album.photos.all():
-                            if photo.is_active:
-                                serializer.data[i]['owner_pic'] = photo.photo_url
-            return Response(serializer.data)
-        except ValidationError:
+            paginator = KeysetPagination(ordering=Comment.ORDERINGS[order])
+            comments = paginator.paginate_queryset(Comment.objects.filter(
+                post=post_pk).select_related('user__profile'), request)
+        except (ValueError, ValidationError):
             raise Http404
+        serializer = CommentSerializer(
+            comments, many=True, context={'request': request})
+        data = serializer.data
+        avatars = Photo.objects.active_avatars(
+            {comment.user.profile.id for comment in comments})
+        for i, comment in enumerate(comments):
+            profile = comment.user.profile
+            data[i]['profile_id'] = profile.id
+            data[i]['post_id'] = comment.post_id
+            data[i].update(owner_data(request, profile, avatars))
+        return paginator.get_paginated_response(data)
 
     def post(self, request, post_pk):
         try:
@@ -696,20 +847,15 @@ class CommentList(APIView):
             if serializer.is_valid():
                 try:
                     post = Post.objects.get(pk=post_pk)
-                    instance = serializer.save(post=post, user=request.user)
+                    with transaction.atomic():
+                        instance = serializer.save(post=post, user=request.user)
+                        Post.objects.add_to_counter(post.id, 'comment_count', 1)
+                    profile = instance.user.profile
                     data = {**serializer.data}
                     data['post_id'] = post.id
-                    data['profile_id'] = post.user.profile.id
-                    profile = request.build_absolute_uri(
-                        reverse('profile-detail', args=(data['profile_id'],))
-                    )
-                    data['profile'] = profile
-                    data['owner_name'] = instance.user.profile.full_name                    
-                    for album in instance.user.profile.albums.all():
-                        if album.name == 'avatar':
-                            for photo in album.photos.all():
-                                if photo.is_active:
-                                    data['owner_pic'] = photo.photo_url
+                    data['profile_id'] = profile.id
+                    data.update(owner_data(
+                        request, profile, Photo.objects.active_avatars([profile.id])))
                     return Response(data, status=status.HTTP_201_CREATED)
                 except Post.DoesNotExist:
                     raise Http404
@@ -732,6 +878,7 @@ class CommentDetail(APIView):
         self.check_object_permissions(self.request, comment)
         return comment
 
+    @conditional(comment_etag, private=True, no_cache=True)
     def get(self, request, *args, **kwargs):
         comment = self.get_object(**kwargs)
         serializer = CommentSerializer(comment, context={'request': request})
@@ -752,7 +899,9 @@ class CommentDetail(APIView):
 
     def delete(self, request, *args, **kwargs):
         comment = self.get_object(**kwargs)
-        comment.delete()
+        with transaction.atomic():
+            comment.delete()
+            Post.objects.add_to_counter(comment.post_id, 'comment_count', -1)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -760,10 +909,12 @@ class ShareList(APIView):
 
     def get(self, request, post_pk):
         try:
-            shares = Share.objects.filter(post=post_pk)
+            paginator = KeysetPagination(ordering=('id',))
+            shares = paginator.paginate_queryset(
+                Share.objects.filter(post=post_pk), request)
             serializer = ShareSerializer(
                 shares, many=True, context={'request': request})
-            return Response(serializer.data)
+            return paginator.get_paginated_response(serializer.data)
         except ValidationError:
             raise Http404
 
@@ -774,7 +925,9 @@ class ShareList(APIView):
             if serializer.is_valid():
                 try:
                     post = Post.objects.get(pk=post_pk)
-                    serializer.save(post=post, user=request.user)
+                    with transaction.atomic():
+                        serializer.save(post=post, user=request.user)
+                        Post.objects.add_to_counter(post.id, 'share_count', 1)
                     return Response(serializer.data, status=status.HTTP_201_CREATED)
                 except Post.DoesNotExist:
                     raise Http404
@@ -808,7 +961,9 @@ class ShareDetail(APIView):
 
     def delete(self, request, *args, **kwargs):
         share = self.get_object(**kwargs)
-        share.delete()
+        with transaction.atomic():
+            share.delete()
+            Post.objects.add_to_counter(share.post_id, 'share_count', -1)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -817,17 +972,225 @@ class UserDetail(APIView):
     def get(self, request):
         profile = Profile.objects.get(user=request.user)
         serializer = ProfileSerializer(profile, context={'request': request})
-        likes = Like.objects.filter(user=request.user)
-        postsId = []
-        for like in likes:
-            postsId.append({
-                "post_id": like.post.id,
-                "like_id": like.id
-            })
-        data = {**serializer.data, "liked_postsId": postsId}
-        for album in profile.albums.all():
-            if album.name == 'avatar':
-                for photo in album.photos.all():
-                    if photo.is_active:
-                        return Response({**data, 'avatar': photo.photo_url})
-        return Response(data)
\ No newline at end of file
+        data = serializer.data
+        avatar = Photo.objects.active_avatars([profile.id]).get(profile.id)
+        if avatar is not None:
+            return Response({**data, 'avatar': avatar})
+        return Response(data)
+
+
+class UserLikeList(APIView):
+    """
+    Like ids of the request user for a batch of posts, e.g. `?posts=1,2,3`.
+    """
+    max_posts = 100
+
+    def get(self, request):
+        try:
+            post_ids = [int(pk) for pk in request.query_params.get('posts', '').split(',') if pk]
+        except ValueError:
+            return Response({"detail": "posts must be a comma separated list of ids."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(post_ids) > self.max_posts:
+            return Response({"detail": f"At most {self.max_posts} posts per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        liked = Like.objects.liked_ids(request.user, post_ids)
+        return Response([
+            {"post_id": post_id, "like_id": like_id} for post_id, like_id in liked.items()
+        ])
+
+
+class FriendSuggestionList(APIView):
+    """
+    People you may know: friends of the request user's friends, most mutual
+    friends first, leaving out pending friend requests. `?limit=` (max 50).
+    """
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request):
+        try:
+            limit = max(1, min(int(request.query_params['limit']), self.max_limit))
+        except (KeyError, ValueError):
+            limit = self.default_limit
+        username = request.user.username
+        pending = User.objects.filter(
+            Q(invitations_from__to_user=username) | Q(invitations_to__from_user=username)
+        ).values_list('id', flat=True)
+        suggestions = get_friend_graph().suggestions(request.user.id, limit, exclude=pending)
+        profiles = {
+            profile.owner_id: profile for profile in Profile.objects.filter(
+                user__id__in=[user_id for user_id, _ in suggestions]
+            ).annotate(owner_id=F('user__id'))
+        }
+        cards = [(profiles[user_id], mutual) for user_id, mutual in suggestions if user_id in profiles]
+        serializer = ProfileCardSerializer([profile for profile, _ in cards], many=True, context={
+            'request': request,
+            'avatars': Photo.objects.active_avatars([profile for profile, _ in cards]),
+        })
+        data = serializer.data
+        for i, (_, mutual) in enumerate(cards):
+            data[i]['mutual_friends'] = mutual
+        return Response(data)
+
+
+class FriendList(APIView):
+    """
+    Friends of a profile as profile cards, paginated, with the total `count`.
+    """
+
+    def get(self, request, profile_pk):
+        try:
+            profile = Profile.objects.only('id', 'user').get(pk=profile_pk)
+        except (ValueError, Profile.DoesNotExist):
+            raise Http404
+        count = Friendship.objects.filter(user=profile.user_id).values_list(
+            'num_friends', flat=True).first() or 0
+        queryset = Profile.objects.filter(
+            user__friendship__friends__user=profile.user_id).only('id', 'first_name', 'last_name')
+        paginator = KeysetPagination(ordering=('id',))
+        profiles = paginator.paginate_queryset(queryset, request)
+        serializer = ProfileCardSerializer(profiles, many=True, context={
+            'request': request,
+            'avatars': Photo.objects.active_avatars(profiles),
+        })
+        return paginator.get_paginated_response(serializer.data, count=count)
+
+
+class FriendDetail(APIView):
+    """
+    Unfriend a friend of the request user.
+    """
+
+    def delete(self, request, username):
+        try:
+            friend = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise Http404
+        if not Friendship.objects.are_friends(request.user, friend):
+            raise Http404
+        with transaction.atomic():
+            Friendship.objects.unfriend(request.user, friend)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class FriendshipRequestList(APIView):
+    """
+    Pending friend requests of the request user, received (`?box=inbox`, the
+    default) or sent (`?box=outbox`), newest first, with the profile card of
+    the other user. Posting sends a friend request.
+    """
+    boxes = {
+        'inbox': ('to_user', 'from_user'),
+        'outbox': ('from_user', 'to_user'),
+    }
+
+    def get(self, request):
+        box = request.query_params.get('box', 'inbox')
+        if box not in self.boxes:
+            return Response({"detail": "box must be inbox or outbox."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        owner, other = self.boxes[box]
+        queryset = FriendshipRequest.objects.filter(**{owner: request.user.username})
+        paginator = KeysetPagination(ordering=('-created', '-id'))
+        requests = paginator.paginate_queryset(queryset, request)
+        profiles = {
+            profile.user_id: profile for profile in Profile.objects.filter(
+                user__in=[getattr(r, f'{other}_id') for r in requests]
+            ).only('id', 'first_name', 'last_name', 'user')
+        }
+        avatars = Photo.objects.active_avatars(profiles.values())
+        data = FriendshipRequestSerializer(requests, many=True, context={'request': request}).data
+        for i, friendship_request in enumerate(requests):
+            profile = profiles.get(getattr(friendship_request, f'{other}_id'))
+            data[i]['profile'] = profile and ProfileCardSerializer(profile, context={
+                'request': request, 'avatars': avatars}).data
+        return paginator.get_paginated_response(data)
+
+    def post(self, request):
+        serializer = FriendshipRequestSerializer(
+            data=request.data, context={'request': request})
+        if serializer.is_valid():
+            try:
+                with transaction.atomic():
+                    serializer.save(from_user=request.user)
+            except ValidationError as err:
+                return Response({"detail": err.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+            except IntegrityError:
+                # unique_friendship_request
+                return Response({"detail": "You already sent a friend request to this user."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            friendship_request_created.send(sender=FriendshipRequest)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class FriendshipRequestCount(APIView):
+    """
+    Number of pending friend requests received by the request user, for the
+    notification badge. Counted on the inbox index.
+    """
+
+    def get(self, request):
+        count = FriendshipRequest.objects.filter(to_user=request.user.username).count()
+        return Response({'count': count})
+
+
+class FriendshipRequestDetail(APIView):
+    """
+    A friend request of the request user, deleting it cancels (sender) or
+    declines (receiver) it.
+    """
+
+    def get_object(self, pk):
+        try:
+            friendship_request = FriendshipRequest.objects.get(pk=pk)
+        except FriendshipRequest.DoesNotExist:
+            raise Http404
+        if self.request.user.username not in (friendship_request.from_user_id, friendship_request.to_user_id):
+            raise Http404
+        return friendship_request
+
+    def get(self, request, pk):
+        friendship_request = self.get_object(pk)
+        serializer = FriendshipRequestSerializer(friendship_request, context={'request': request})
+        return Response(serializer.data)
+
+    def delete(self, request, pk):
+        friendship_request = self.get_object(pk)
+        if friendship_request.from_user_id == request.user.username:
+            friendship_request.cancel()
+        else:
+            friendship_request.decline()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class FriendshipRequestAnswer(APIView):
+    """
+    Accept or decline friend requests sent to the request user, either one
+    (`<pk>/accept/`, `<pk>/decline/`) or many in one transaction (`bulk/` with
+    `{"action": "accept", "ids": [...]}`, every pending request when `ids` is left out).
+    """
+    answers = {
+        'accept': ('accepted', FriendshipRequest.objects.accept_many),
+        'decline': ('declined', FriendshipRequest.objects.decline_many),
+    }
+
+    def post(self, request, pk=None, action=None):
+        if pk is not None:
+            ids = [pk]
+        else:
+            action = request.data.get('action')
+            ids = request.data.get('ids')
+            if ids is not None and (not isinstance(ids, list)
+                                    or not all(isinstance(pk, int) for pk in ids)):
+                return Response({"detail": "ids must be a list of request ids."},
+                                status=status.HTTP_400_BAD_REQUEST)
+        if action not in self.answers:
+            return Response({"detail": "action must be accept or decline."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        result, answer = self.answers[action]
+        answered = answer(request.user, ids)
+        if pk is not None and not answered:
+            raise Http404
+        return Response({result: answered})